@@ -0,0 +1,47 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, TypeVar
+import os
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+
+def _apply_to_chunk(fn: Callable[[T], U], chunk: List[T]) -> List[U]:
+    return [fn(item) for item in chunk]
+
+
+def ordered_map(
+    fn: Callable[[T], U],
+    items: Iterable[T],
+    workers: Optional[int] = 1,
+    chunk_size: int = 16,
+) -> Iterator[U]:
+    """Lazily applies fn to every item, in input order
+    Args:
+        fn (Callable): a module level function, so it can be sent to the workers
+        items (Iterable): the inputs, consumed only as fast as the workers need them
+        workers (Optional[int]): number of processes, None or 0 for one per core
+            and 1 to run in the current process
+        chunk_size (int): number of items sent to a worker at once
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        yield from map(fn, items)
+        return
+
+    items = iter(items)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep only a couple of chunks per worker in flight, so memory stays bounded
+        max_pending = 2 * workers
+        pending: Deque[Future] = deque()
+        while True:
+            while len(pending) < max_pending:
+                chunk = list(islice(items, chunk_size))
+                if not chunk:
+                    break
+                pending.append(executor.submit(_apply_to_chunk, fn, chunk))
+            if not pending:
+                return
+            yield from pending.popleft().result()
@@ -0,0 +1,451 @@
+from argparse import ArgumentParser
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+from array import array
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from fsm import FSM, PARTITION_ALGORITHMS
+from simulation import Simulator
+from main import iter_test_cases
+from cyk import (
+    ENGINES,
+    Grammar,
+    GrammarCache,
+    Terminal,
+    Variable,
+    del_extra_spaces,
+    parse_input,
+    parse_productions,
+    solve,
+)
+from generators import (
+    cyk_input,
+    fsm_input,
+    random_cnf_grammar,
+    random_derivation,
+    random_fsm,
+    random_machine,
+    random_string,
+)
+
+T = TypeVar("T")
+
+
+def bench_partitions(args: Dict[str, Any]) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    for n_states in args["sizes"]:
+        for algorithm in args["algorithms"]:
+            if algorithm == "moore" and n_states > args["moore_max_states"]:
+                continue
+            fsm = random_fsm(
+                n_states, args["inputs"], args["outputs"], args["seed"], algorithm
+            )
+            start = time.perf_counter()
+            blocks = fsm.blocks
+            elapsed = time.perf_counter() - start
+            results.append(
+                {
+                    "algorithm": algorithm,
+                    "states": n_states,
+                    "blocks": len(blocks),
+                    "seconds": elapsed,
+                }
+            )
+            print(f"{algorithm:>10} |Q|={n_states:<8} blocks={len(blocks):<8} {elapsed:.3f}s")
+    return results
+
+
+def bench_simulation(args: Dict[str, Any]) -> List[Dict[str, Any]]:
+    fsm = random_fsm(args["states"], args["inputs"], args["outputs"], args["seed"])
+    simulator = Simulator(fsm)
+    rng = np.random.default_rng(args["seed"])
+    n_symbols = args["symbols"]
+    results: List[Dict[str, Any]] = []
+
+    def report(mode: str, sequences: int, elapsed: float) -> None:
+        results.append(
+            {
+                "mode": mode,
+                "sequences": sequences,
+                "symbols": n_symbols,
+                "seconds": elapsed,
+                "symbols_per_second": n_symbols / elapsed,
+            }
+        )
+        print(f"{mode:>10} sequences={sequences:<8} {n_symbols / elapsed:,.0f} symbols/s")
+
+    stimuli = [fsm.S[a] for a in rng.integers(len(fsm.S), size=n_symbols).tolist()]
+    start = time.perf_counter()
+    for _ in simulator.stream(stimuli):
+        pass
+    report("stream", 1, time.perf_counter() - start)
+
+    # run_batch converts the names of the stimuli and outputs, run_indices does not
+    for n_sequences in args["batch_sizes"]:
+        indices = rng.integers(len(fsm.S), size=(n_sequences, n_symbols // n_sequences))
+        sequences = [[fsm.S[a] for a in row] for row in indices.tolist()]
+        start = time.perf_counter()
+        simulator.run_batch(sequences)
+        report("run_batch", n_sequences, time.perf_counter() - start)
+        start = time.perf_counter()
+        simulator.run_indices(indices)
+        report("indices", n_sequences, time.perf_counter() - start)
+    return results
+
+
+def example_grammar() -> Grammar:
+    """Grammar of the first test case of cyk_input.txt"""
+    variables = set(map(Variable, "S A B C".split()))
+    terminals = set(map(Terminal, "a b".split()))
+    productions = parse_productions(
+        ["S -> AB | BC", "A -> BA | a", "B -> CC | b", "C -> AB | a"], variables, terminals
+    )
+    return Grammar(
+        start=Variable("S"), variables=variables, terminals=terminals, productions=productions
+    )
+
+
+def bench_cyk(args: Dict[str, Any]) -> List[Dict[str, Any]]:
+    G = example_grammar()
+    results: List[Dict[str, Any]] = []
+    for length in args["sizes"]:
+        string = random_string(length, sorted(map(str, G.terminals)), args["seed"])
+        for engine in args["engines"]:
+            if engine == "classic" and length > args["classic_max_length"]:
+                continue
+            start = time.perf_counter()
+            answer = solve(G, string, engine=engine)
+            elapsed = time.perf_counter() - start
+            results.append(
+                {"engine": engine, "length": length, "result": answer.result, "seconds": elapsed}
+            )
+            print(f"{engine:>10} n={length:<8} result={answer.result!s:<6} {elapsed:.3f}s")
+    return results
+
+
+# Fields of a result that are measured, the others identify the benchmark
+MEASURES = ("seconds", "mean_seconds", "peak_bytes", "symbols_per_second")
+OUTCOMES = ("blocks", "result")
+
+
+def measure(
+    setup: Callable[[], T], run: Callable[[T], Any], repeat: int, memory: bool
+) -> Tuple[Dict[str, float], T]:
+    """Best and mean time of run over repeat fresh subjects made by setup, and the
+    peak of the memory allocated by one more run, traced with tracemalloc.
+    The last subject run is returned with them"""
+    times: List[float] = list()
+    for _ in range(repeat):
+        subject = setup()
+        start = time.perf_counter()
+        run(subject)
+        times.append(time.perf_counter() - start)
+    measures = {"seconds": min(times), "mean_seconds": sum(times) / len(times)}
+    if memory:
+        subject = setup()
+        tracemalloc.start()
+        try:
+            run(subject)
+            measures["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return measures, subject
+
+
+def copy_fsm(fsm: FSM, partition_algorithm: Optional[str] = None) -> FSM:
+    """Same machine without the partitions and states found so far"""
+    return FSM(
+        S=fsm.S,
+        R=fsm.R,
+        Q=fsm.Q,
+        init_state=fsm.init_state,
+        partition_algorithm=partition_algorithm or fsm.partition_algorithm,
+        _next_state=array("i", fsm._next_state),
+        _output=array("i", fsm._output),
+    )
+
+
+def bench_suite(args: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Times the FSM and CYK solvers, from parsing their input to solving it, on
+    seeded random workloads of growing size"""
+    results: List[Dict[str, Any]] = []
+
+    def record(
+        benchmark: str,
+        size: int,
+        setup: Callable[[], T],
+        run: Callable[[T], Any],
+        outcome: Optional[Callable[[T], Dict[str, Any]]] = None,
+    ) -> None:
+        """outcome gives the OUTCOMES of the last subject run, once it is timed"""
+        result: Dict[str, Any] = {"benchmark": benchmark, "size": size}
+        measures, subject = measure(setup, run, args["repeat"], not args["no_memory"])
+        result.update(measures)
+        if outcome is not None:
+            result.update(outcome(subject))
+        results.append(result)
+        peak = f"{result['peak_bytes'] / 2**20:9.1f} MiB" if "peak_bytes" in result else ""
+        print(f"{benchmark:>28} size={size:<8} {result['seconds']:.4f}s {peak}")
+
+    for n_states in args["fsm_sizes"]:
+        n_reachable = n_states - round(args["unreachable"] * n_states)
+        n_classes = max(1, round(args["classes"] * n_reachable))
+        fsm = random_machine(
+            n_states,
+            args["inputs"],
+            args["outputs"],
+            n_classes,
+            args["unreachable"],
+            args["moore"],
+            args["seed"],
+        )
+        text = fsm_input([fsm], args["moore"])
+        record(
+            "fsm.parse",
+            n_states,
+            lambda: text.split("\n"),
+            lambda lines: list(iter_test_cases(lines)),
+        )
+        record("fsm.connected", n_states, lambda: copy_fsm(fsm), FSM.connected)
+        for algorithm in args["algorithms"]:
+            if algorithm == "moore" and n_states > args["moore_max_states"]:
+                continue
+            record(
+                f"fsm.partitions[{algorithm}]",
+                n_states,
+                lambda: copy_fsm(fsm, algorithm),
+                FSM.compute_partitions,
+                lambda machine: {"blocks": len(machine.blocks)},
+            )
+
+        def partitioned() -> FSM:
+            machine = copy_fsm(fsm, "hopcroft")
+            machine.compute_partitions()
+            return machine
+
+        record("fsm.minimum_equivalent", n_states, partitioned, FSM.minimum_equivalent)
+
+    G = random_cnf_grammar(
+        args["variables"], args["terminals"], args["binary_rules"], seed=args["seed"]
+    )
+    for length in args["cyk_lengths"]:
+        string = random_derivation(G, length, args["seed"])
+        lines = cyk_input([(G, string)]).split("\n")
+        record(
+            "cyk.parse",
+            length,
+            lambda: list(map(del_extra_spaces, lines[1:])),
+            lambda body: list(parse_input(body, 1, cache=GrammarCache())),
+        )
+        for engine in args["engines"]:
+            if engine == "classic" and length > args["classic_max_length"]:
+                continue
+            record(
+                f"cyk.solve[{engine}]", length, lambda: string, lambda s: solve(G, s, engine=engine)
+            )
+    return results
+
+
+# Options that only choose which benchmarks run and how, the others set the
+# workloads, which must be the same as the ones of the baseline
+RUN_OPTIONS = (
+    "sizes",
+    "fsm_sizes",
+    "cyk_lengths",
+    "batch_sizes",
+    "algorithms",
+    "engines",
+    "moore_max_states",
+    "classic_max_length",
+    "repeat",
+    "no_memory",
+    "tolerance",
+)
+
+
+def workload_differences(options: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Options setting the workloads whose value is not the one of the baseline"""
+    names = sorted((set(options) | set(baseline)) - set(RUN_OPTIONS))
+    return [
+        f"{name}: {baseline.get(name)!r} in the baseline, {options.get(name)!r} now"
+        for name in names
+        if options.get(name) != baseline.get(name)
+    ]
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float
+) -> int:
+    """Prints the time of every result against the same benchmark of the baseline
+    Return:
+        regressions (int): results slower than the baseline by more than tolerance
+    """
+
+    def key(result: Dict[str, Any]) -> str:
+        return json.dumps(
+            {k: v for k, v in result.items() if k not in MEASURES + OUTCOMES}, sort_keys=True
+        )
+
+    baseline_seconds = {key(r): r["seconds"] for r in baseline if "seconds" in r}
+    regressions = 0
+    for result in results:
+        before = baseline_seconds.get(key(result))
+        if before is None or "seconds" not in result:
+            continue
+        ratio = result["seconds"] / before if before else float("inf")
+        slower = ratio > 1 + tolerance
+        regressions += slower
+        flag = " REGRESSION" if slower else ""
+        print(f"{key(result)}: {before:.4f}s -> {result['seconds']:.4f}s x{ratio:.2f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    partitions_parser = commands.add_parser("partitions", help="FSM partition algorithms")
+    partitions_parser.set_defaults(bench=bench_partitions)
+    partitions_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 200000],
+    )
+    partitions_parser.add_argument(
+        "--algorithms",
+        nargs="+",
+        choices=PARTITION_ALGORITHMS,
+        default=list(PARTITION_ALGORITHMS),
+    )
+    partitions_parser.add_argument(
+        "--moore-max-states",
+        help="skip the moore algorithm on bigger machines",
+        type=int,
+        default=20000,
+    )
+    partitions_parser.add_argument("--inputs", type=int, default=2)
+    partitions_parser.add_argument("--outputs", type=int, default=2)
+
+    simulation_parser = commands.add_parser("simulation", help="FSM simulation throughput")
+    simulation_parser.set_defaults(bench=bench_simulation)
+    simulation_parser.add_argument("--states", type=int, default=1000)
+    simulation_parser.add_argument("--inputs", type=int, default=2)
+    simulation_parser.add_argument("--outputs", type=int, default=2)
+    simulation_parser.add_argument(
+        "--symbols", help="stimuli run in every mode", type=int, default=1_000_000
+    )
+    simulation_parser.add_argument(
+        "--batch-sizes",
+        help="sequences run together by run_batch and run_indices",
+        type=int,
+        nargs="+",
+        default=[100, 10000],
+    )
+
+    cyk_parser = commands.add_parser("cyk", help="CYK engines on random strings")
+    cyk_parser.set_defaults(bench=bench_cyk)
+    cyk_parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 2000])
+    cyk_parser.add_argument(
+        "--engines", nargs="+", choices=ENGINES, default=["classic", "matrix"],
+    )
+    cyk_parser.add_argument(
+        "--classic-max-length",
+        help="skip the classic engine on longer strings",
+        type=int,
+        default=500,
+    )
+
+    suite_parser = commands.add_parser(
+        "suite", help="parsing and solving of the FSM and CYK solvers, with memory peaks"
+    )
+    suite_parser.set_defaults(bench=bench_suite)
+    suite_parser.add_argument(
+        "--fsm-sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+    )
+    suite_parser.add_argument(
+        "--algorithms",
+        nargs="+",
+        choices=PARTITION_ALGORITHMS,
+        default=list(PARTITION_ALGORITHMS),
+    )
+    suite_parser.add_argument(
+        "--moore-max-states",
+        help="skip the moore algorithm on bigger machines",
+        type=int,
+        default=20000,
+    )
+    suite_parser.add_argument("--inputs", type=int, default=2)
+    suite_parser.add_argument("--outputs", type=int, default=2)
+    suite_parser.add_argument(
+        "--classes",
+        help="equivalence classes, as a fraction of the accessible states",
+        type=float,
+        default=0.5,
+    )
+    suite_parser.add_argument(
+        "--unreachable", help="fraction of the states not accessible", type=float, default=0.1,
+    )
+    suite_parser.add_argument(
+        "--moore", help="Moore machines instead of Mealy machines", action="store_true",
+    )
+    suite_parser.add_argument("--cyk-lengths", type=int, nargs="+", default=[20, 100, 500])
+    suite_parser.add_argument("--variables", type=int, default=8)
+    suite_parser.add_argument("--terminals", type=int, default=2)
+    suite_parser.add_argument(
+        "--binary-rules", help="rules A -> BC of every variable", type=int, default=2,
+    )
+    suite_parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    suite_parser.add_argument(
+        "--classic-max-length",
+        help="skip the classic engine on longer strings",
+        type=int,
+        default=20,
+    )
+    suite_parser.add_argument(
+        "--repeat", help="runs of every benchmark, the best is kept", type=int, default=3,
+    )
+    suite_parser.add_argument(
+        "--no-memory", help="do not trace the memory peaks", action="store_true",
+    )
+
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="JSON file where the results are written")
+    parser.add_argument(
+        "--baseline", help="JSON file of a previous run to compare the times against",
+    )
+    parser.add_argument(
+        "--tolerance",
+        help="slowdown over the baseline reported as a regression",
+        type=float,
+        default=0.1,
+    )
+    args = parser.parse_args()
+    options = {k: v for k, v in vars(args).items() if k not in ("bench", "output", "baseline")}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        differences = workload_differences(options, baseline.get("options", dict()))
+        if differences:
+            print("Not comparable with the baseline, its workloads differ:", file=sys.stderr)
+            print("\n".join(differences), file=sys.stderr)
+            sys.exit(2)
+    results = args.bench(vars(args))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "platform": platform.platform(),
+                    "options": options,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+    if args.baseline is not None:
+        # Non zero exit status when slower, so the comparison can gate a build
+        sys.exit(1 if compare(results, baseline["results"], args.tolerance) else 0)
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import sqlite3
+import time
+
+from cyk import del_extra_spaces
+
+
+def _normalized_lines(text: str) -> List[str]:
+    return [line for line in (del_extra_spaces(line).strip() for line in text.split("\n")) if line]
+
+
+def canonical_fsm_input(text: str) -> str:
+    """Input of the FSM solver with its spaces collapsed, the blank lines dropped and
+    the transition rows of every test case sorted when every state has a single
+    row, since then their order does not change the machines. When a state has
+    several rows the later ones overwrite the earlier ones, so they are kept in
+    order. Inputs that are not well formed are only normalized."""
+    lines = _normalized_lines(text)
+    try:
+        canonical = [lines[0]]
+        i = 1
+        for _ in range(int(lines[0])):
+            n_states = len(lines[i + 3].split())
+            rows = lines[i + 4 : i + 4 + n_states]
+            if len({row.split(" ", 1)[0] for row in rows}) == len(rows):
+                rows = sorted(rows)
+            canonical += lines[i : i + 4] + rows
+            i += 4 + n_states
+        return "\n".join(canonical + lines[i:])
+    except (IndexError, ValueError):
+        return "\n".join(lines)
+
+
+def canonical_cyk_input(text: str) -> str:
+    """Input of the CYK solver with its spaces collapsed and the lines after the
+    last test case dropped. It is read by line position, so the other lines are
+    all kept, blank ones too. Inputs that are not well formed are only collapsed."""
+    lines = list(map(del_extra_spaces, text.split("\n")))
+    try:
+        i = 1
+        for _ in range(int(lines[0])):
+            # String, start variable, variables, terminals and a rule per variable
+            i += 4 + len(set(lines[i + 2].split()))
+    except (IndexError, ValueError):
+        return "\n".join(lines)
+    return "\n".join(lines[:i])
+
+
+class ResultCache:
+    """LRU cache of serialized results, bounded by their total size in bytes
+
+    Arguments:
+        max_bytes (int): size of the results kept in memory, the least recently
+            used ones are evicted first. 0 keeps nothing in memory.
+        ttl (Optional[float]): seconds a result is kept, None to keep it until
+            it is evicted.
+        path (Optional[str]): SQLite file where the results are also written, so
+            they survive restarts and are shared by the processes of the server.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: Optional[float] = 3600,
+        path: Optional[str] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        # key -> (expiry time or None, result)
+        self._results: "OrderedDict[str, Tuple[Optional[float], bytes]]" = OrderedDict()
+        self._lock = Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, expires REAL, result BLOB)"
+            )
+            self._db.execute("DELETE FROM results WHERE expires < ?", (time.time(),))
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        return hashlib.sha1("\0".join(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires, result FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], bytes(row[1]))
+                    self._store(key, entry)
+            if entry is not None and entry[0] is not None and entry[0] < now:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if key in self._results:
+                self._results.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, result: bytes) -> None:
+        entry = (None if self.ttl is None else time.time() + self.ttl, result)
+        with self._lock:
+            self._store(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, entry[0], result)
+                )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._results),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _store(self, key: str, entry: Tuple[Optional[float], bytes]) -> None:
+        if len(entry[1]) > self.max_bytes:
+            return
+        if key in self._results:
+            self._bytes -= len(self._results[key][1])
+        self._results[key] = entry
+        self._results.move_to_end(key)
+        self._bytes += len(entry[1])
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._results.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._results.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+        if self._db is not None:
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
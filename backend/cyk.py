@@ -1,8 +1,18 @@
-from typing import List, Tuple, Set, Dict, Any, NamedTuple, Union, Iterator
+from typing import List, Tuple, Set, FrozenSet, Dict, Any, NamedTuple, Union, Iterator, Iterable, Optional, Callable
 from argparse import ArgumentParser
+from array import array
+from batch import ordered_map
+from profiling import profiler
 from dataclasses import dataclass
+from functools import partial
+from collections import OrderedDict
+from itertools import chain, permutations, product
+import hashlib
 import logging
 import re
+import sys
+
+import numpy as np
 
 logging.basicConfig(
     filename="log_file_name.log",
@@ -13,6 +23,11 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 EMPTY_SET: Set[Any] = set()
+ENGINES = ("classic", "bitset", "matrix")
+CNF_STEPS = ("TERM", "BIN", "DEL", "UNIT")
+# DEL writes a rule once per subset of its nullable symbols, orders of the steps
+# needing more are skipped
+MAX_NULLABLE_SYMBOLS = 10
 
 
 class ParsingError(Exception):
@@ -20,12 +35,41 @@ class ParsingError(Exception):
 
 
 class Symbol(object):
-    def __init__(self, name: str):
-        self.name = name
-        if len(self.name) != 1:
-            raise ValueError(f"Symbol name must be 1 character long, got {self.name}")
+    """Grammar symbol, interned: there is a single instance per class and name.
+
+    Symbols use __slots__ and cache their hash. Since equal symbols are the same
+    object, sets and dicts of symbols resolve lookups by identity and rarely call
+    __eq__. Symbols still compare equal to strings with their name.
+    """
+
+    __slots__ = ("name", "_hash")
+    _instances: Dict[str, "Symbol"] = dict()
+
+    def __new__(cls, name: str) -> "Symbol":
+        symbol = cls._instances.get(name)
+        if symbol is None:
+            if len(name) != 1:
+                raise ValueError(f"Symbol name must be 1 character long, got {name}")
+            cls._check_name(name)
+            symbol = super().__new__(cls)
+            symbol.name = name
+            symbol._hash = hash(name)
+            cls._instances[name] = symbol
+        return symbol
+
+    @staticmethod
+    def _check_name(name: str) -> None:
+        pass
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return (type(self), (self.name,))
 
     def __eq__(self, o: object) -> bool:
+        if self is o:
+            return True
+        if type(o) is type(self):
+            # Interned, so another instance of the same class has another name
+            return False
         if isinstance(o, Symbol):
             return self.name == o.name
         if isinstance(o, str):
@@ -42,21 +86,27 @@ class Symbol(object):
         return self.name
 
     def __hash__(self) -> int:
-        return hash(self.name)
+        return self._hash
 
 
 class Variable(Symbol):
-    def __init__(self, name: str):
-        super().__init__(name)
-        if self.name.isalpha() and not self.name.isupper():
-            logger.debug("Variable should be uppercase, got {self.name}")
+    __slots__ = ()
+    _instances: Dict[str, "Variable"] = dict()
+
+    @staticmethod
+    def _check_name(name: str) -> None:
+        if name.isalpha() and not name.isupper():
+            logger.debug(f"Variable should be uppercase, got {name}")
 
 
 class Terminal(Symbol):
-    def __init__(self, name: str):
-        super().__init__(name)
-        if self.name.isalpha() and not self.name.isupper():
-            logger.debug("Terminal should be lowercase, got {self.name}")
+    __slots__ = ()
+    _instances: Dict[str, "Terminal"] = dict()
+
+    @staticmethod
+    def _check_name(name: str) -> None:
+        if name.isalpha() and name.isupper():
+            logger.debug(f"Terminal should be lowercase, got {name}")
 
 
 Production = Tuple[Union[Terminal, Variable], ...]
@@ -72,6 +122,70 @@ class Grammar:
     productions: Dict[Variable, Set[Production]]
 
 
+class CYKTrace:
+    """Step by step explanation of a CYK run.
+
+    The steps only depend on the grammar and the finished table, so nothing is
+    recorded while solving: `events` replays them as tuples
+    ("span", i, j), ("split", k, left_variables, right_variables), ("skip",),
+    ("add", variable, production), ("end_split",) and ("end_row",), and `render`
+    formats them once, the first time the text is needed.
+    """
+
+    def __init__(self, grammar: Grammar, string: InputString, table: ProcessTable):
+        self.grammar = grammar
+        self.string = string
+        self.table = table
+        self._text: Optional[str] = None
+
+    def events(self) -> Iterator[Tuple[Any, ...]]:
+        string, table = self.string, self.table
+        for j in range(2, len(string) + 1):
+            for i in range(len(string) - j + 1):
+                yield ("span", i, j)
+                for k in range(1, j):
+                    left_prod = table[k - 1][i]
+                    right_prod = table[j - k - 1][i + k]
+                    yield ("split", k, left_prod, right_prod)
+                    if left_prod == EMPTY_SET or right_prod == EMPTY_SET:
+                        yield ("skip",)
+                        yield ("end_split",)
+                        continue
+                    for candidate_production in cartesian_product_productions(left_prod, right_prod):
+                        for variable, productions in self.grammar.productions.items():
+                            for production in productions:
+                                if candidate_production == production:
+                                    yield ("add", variable, candidate_production)
+                    yield ("end_split",)
+            yield ("end_row",)
+
+    @profiler.timed("cyk.explanation")
+    def render(self) -> str:
+        if self._text is None:
+            lines: List[str] = []
+            i, j = 0, 0
+            for event in self.events():
+                kind = event[0]
+                if kind == "span":
+                    _, i, j = event
+                    lines.append(f"i = {i}, j = {j}, {prod2str(self.string[i : i + j])}\n")
+                elif kind == "split":
+                    _, k, left_prod, right_prod = event
+                    left, right = self.string[i : i + k], self.string[i + k : i + j]
+                    lines.append(
+                        f"\tk = {k}, \n\t{prod2str(left)}: {left_prod}, \n\t{prod2str(right)}: {right_prod}\n"
+                    )
+                elif kind == "skip":
+                    lines.append("\tSkipping since none produces left or right\n")
+                elif kind == "add":
+                    _, variable, production = event
+                    lines.append(f"\tAdding {variable} because produces {''.join(str(s) for s in production)}\n")
+                else:
+                    lines.append("\n")
+            self._text = "".join(lines)
+        return self._text
+
+
 class Answer(NamedTuple):
     """Class defining the format of the answer
     and process to determine wheter
@@ -83,6 +197,12 @@ class Answer(NamedTuple):
         grammar: Grammar: grammar to be used.
         answer (bool): True if the string is produced by the grammar.
         table (List[List[Union[Set[Variable], None]]]): CYK table
+        trace (Optional[CYKTrace]): steps of the algorithm, only when solving with
+            trace=True. `explanation` renders them as text
+        forest (Optional[ParseForest]): derivations of the string, only when
+            solving with forest=True
+        cnf_metrics (Optional[CNFMetrics]): how the grammar was converted to Chomsky
+            normal form before solving, None if it already was
     Usage:
     ´´´
     string = ["b","a","a","b","a"]
@@ -156,7 +276,13 @@ class Answer(NamedTuple):
     grammar: Grammar
     result: bool
     table: ProcessTable
-    explanation: str
+    trace: Optional[CYKTrace] = None
+    forest: Optional["ParseForest"] = None
+    cnf_metrics: Optional["CNFMetrics"] = None
+
+    @property
+    def explanation(self) -> str:
+        return self.trace.render() if self.trace is not None else ""
 
 
 def initialize_table(string: InputString, G: Grammar) -> ProcessTable:
@@ -177,6 +303,28 @@ def initialize_table(string: InputString, G: Grammar) -> ProcessTable:
     return table
 
 
+def fill_classic_table(string: InputString, G: Grammar) -> ProcessTable:
+    """CYK table of the string, comparing every pair of variables against every production"""
+    table = initialize_table(string, G)
+
+    # Fill the rest of the table, start from 2 because we already filled the first row
+    for j in range(2, len(string) + 1):
+        for i in range(len(string) - j + 1):
+            for k in range(1, j):
+                left_prod = table[k - 1][i]
+                right_prod = table[j - k - 1][i + k]
+                if left_prod == EMPTY_SET or right_prod == EMPTY_SET:
+                    continue
+
+                cartesian_product = cartesian_product_productions(left_prod, right_prod)
+                for candidate_production in cartesian_product:
+                    for variable, productions in G.productions.items():
+                        for production in productions:
+                            if candidate_production == production:
+                                table[j - 1][i].add(variable)
+    return table
+
+
 def cartesian_product_productions(
     left_prod: Set[Variable], right_prod: Set[Variable]
 ) -> Iterator[Production]:
@@ -192,40 +340,1071 @@ def prod2str(p: List[Production]) -> str:
     return "".join(str(x[0]) for x in p)
 
 
-def solve(G: Grammar, string: InputString) -> Answer:
-    table = initialize_table(string, G)
-    explanation = ""
+class CompiledGrammar:
+    """Grammar indexed once for the bitset engine.
 
-    # Fill the rest of the table, start from 2 because we already filled the first row
-    for j in range(2, len(string) + 1):
-        for i in range(len(string) - j + 1):
-            substring = string[i : i + j]
-            explanation += f"i = {i}, j = {j}, {prod2str(substring)}\n"
-            for k in range(1, j):
-                left, right = substring[:k], substring[k:]
-                left_prod = table[len(left) - 1][i]
-                right_prod = table[len(right) - 1][i + len(substring) - len(right)]
-                explanation += f"\tk = {k}, \n\t{prod2str(left)}: {left_prod}, \n\t{prod2str(right)}: {right_prod}\n"
+    Every variable gets an id, and a set of variables is stored as an int with the
+    bit of each id set. `terminal_masks` maps a terminal to the variables producing
+    it, and `binary_rules[B]` lists (C, variables producing BC) for every rule with
+    B on the left, so two cells are combined with a few bit operations.
+    `cnf_metrics` tells how `to_cnf` changed the grammar compiled, None when it was
+    already in Chomsky normal form.
+    """
 
-                if left_prod == EMPTY_SET or right_prod == EMPTY_SET:
-                    explanation += f"\tSkipping since none produces left or right\n"
-                    explanation += "\n"
+    def __init__(self, G: Grammar, cnf_metrics: Optional["CNFMetrics"] = None):
+        self.grammar = G
+        self.cnf_metrics = cnf_metrics
+        self.variables: List[Variable] = sorted(G.variables | set(G.productions), key=str)
+        self.variable_ids: Dict[Variable, int] = {v: i for i, v in enumerate(self.variables)}
+        self.terminal_masks: Dict[Symbol, int] = dict()
+        self.binary_rules: List[List[Tuple[int, int]]] = [[] for _ in self.variables]
+        self.right_masks: List[int] = [0] * len(self.variables)
+        self._variable_sets: Dict[int, FrozenSet[Variable]] = dict()
+
+        binary_masks: Dict[Tuple[int, int], int] = dict()
+        for variable, productions in G.productions.items():
+            bit = 1 << self.variable_ids[variable]
+            for production in productions:
+                if len(production) == 1:
+                    symbol = production[0]
+                    self.terminal_masks[symbol] = self.terminal_masks.get(symbol, 0) | bit
+                elif len(production) == 2 and all(s in self.variable_ids for s in production):
+                    pair = (self.variable_ids[production[0]], self.variable_ids[production[1]])
+                    binary_masks[pair] = binary_masks.get(pair, 0) | bit
+        for (left, right), mask in binary_masks.items():
+            self.binary_rules[left].append((right, mask))
+            self.right_masks[left] |= 1 << right
+
+    def combine(self, left: int, right: int) -> int:
+        """Variables producing BC for some B in left and C in right"""
+        produced = 0
+        while left:
+            low_bit = left & -left
+            left ^= low_bit
+            b = low_bit.bit_length() - 1
+            if right & self.right_masks[b]:
+                for c, mask in self.binary_rules[b]:
+                    if right >> c & 1:
+                        produced |= mask
+        return produced
+
+    def variables_of(self, mask: int) -> Set[Variable]:
+        if mask not in self._variable_sets:
+            self._variable_sets[mask] = frozenset(
+                v for i, v in enumerate(self.variables) if mask >> i & 1
+            )
+        # Copying a frozenset reuses the stored hashes of its variables
+        return set(self._variable_sets[mask])
+
+
+class SpanMemo:
+    """Bounded map from a substring to the bitmask of the variables producing it.
+
+    Masks are only meaningful for the compiled grammar that produced them. When
+    full, the oldest substring is dropped.
+    """
+
+    def __init__(self, capacity: int = 65536):
+        self.capacity = capacity
+        self._masks: Dict[str, int] = dict()
+
+    def __len__(self) -> int:
+        return len(self._masks)
+
+    def get(self, substring: str) -> Optional[int]:
+        return self._masks.get(substring)
+
+    def put(self, substring: str, mask: int) -> None:
+        if self.capacity <= 0:
+            return
+        if len(self._masks) >= self.capacity:
+            del self._masks[next(iter(self._masks))]
+        self._masks[substring] = mask
+
+
+def fill_bitset_table(
+    compiled: CompiledGrammar, string: InputString, memo: Optional[SpanMemo] = None
+) -> List[List[int]]:
+    """CYK table where every cell is the bitmask of the variables producing the substring"""
+    return list(iter_bitset_diagonals(compiled, string, memo))
+
+
+def iter_bitset_diagonals(
+    compiled: CompiledGrammar, string: InputString, memo: Optional[SpanMemo] = None
+) -> Iterator[List[int]]:
+    """Rows of the bitset CYK table, lazily, from the substrings of length 1 up.
+    With a memo, the cells of substrings seen before are taken from it instead of
+    being combined again."""
+    n = len(string)
+    text = "".join(str(s[0]) for s in string) if memo is not None else ""
+    # by_start[i][l - 1] and by_end[i + l][l - 1] are the cell of string[i : i + l]
+    by_start: List[List[int]] = [[compiled.terminal_masks.get(s[0], 0)] for s in string]
+    by_end: List[List[int]] = [[]] + [[cell[0]] for cell in by_start]
+    yield [cell[0] for cell in by_start]
+    # Memo of combine() for the pairs of cells seen, keyed by (left << |V|) | right
+    shift = len(compiled.variables)
+    combined: Dict[int, int] = dict()
+    for j in range(2, n + 1):
+        row: List[int] = []
+        for i in range(n - j + 1):
+            mask = memo.get(text[i : i + j]) if memo is not None else None
+            if mask is None:
+                mask = 0
+                for left, right in zip(by_start[i], reversed(by_end[i + j])):
+                    if left and right:
+                        key = left << shift | right
+                        produced = combined.get(key)
+                        if produced is None:
+                            produced = combined[key] = compiled.combine(left, right)
+                        mask |= produced
+                if memo is not None:
+                    memo.put(text[i : i + j], mask)
+            by_start[i].append(mask)
+            by_end[i + j].append(mask)
+            row.append(mask)
+        yield row
+
+
+class IncrementalCYK:
+    """CYK parser fed one terminal at a time, for strings that arrive as a stream.
+
+    It keeps the bitset table of the current string. Appending a terminal only
+    fills the cells of the substrings ending with it, one per start position, so
+    it costs O(n²) combinations instead of the O(n³) of solving from scratch.
+
+    Arguments:
+        G (Union[Grammar, CompiledGrammar]): the grammar, compiled through
+            `grammar_cache` if needed.
+    """
+
+    def __init__(self, G: Union[Grammar, CompiledGrammar]):
+        self.compiled = G if isinstance(G, CompiledGrammar) else grammar_cache.compile(G)
+        self.string: InputString = list()
+        # Same layout as in iter_bitset_diagonals
+        self._by_start: List[List[int]] = list()
+        self._by_end: List[List[int]] = [[]]
+        self._start_bit = 1 << self.compiled.variable_ids[self.compiled.grammar.start]
+        self._shift = len(self.compiled.variables)
+        self._combined: Dict[int, int] = dict()
+
+    def __len__(self) -> int:
+        return len(self.string)
+
+    def append(self, terminal: Union[Terminal, str, Production]) -> bool:
+        """Adds a terminal at the end of the string and tells whether it is accepted"""
+        if isinstance(terminal, tuple):
+            terminal = terminal[0]
+        if not isinstance(terminal, Symbol):
+            terminal = Terminal(terminal)
+        self.string.append((terminal,))
+        end = len(self.string)
+        cell = self.compiled.terminal_masks.get(terminal, 0)
+        self._by_start.append([cell])
+        self._by_end.append([cell])
+        by_end = self._by_end[end]
+        for i in range(end - 2, -1, -1):
+            mask = 0
+            for left, right in zip(self._by_start[i], reversed(by_end)):
+                if left and right:
+                    key = left << self._shift | right
+                    produced = self._combined.get(key)
+                    if produced is None:
+                        produced = self._combined[key] = self.compiled.combine(left, right)
+                    mask |= produced
+            self._by_start[i].append(mask)
+            by_end.append(mask)
+        return self.accepts()
+
+    def extend(self, terminals: Iterable[Union[Terminal, str, Production]]) -> bool:
+        for terminal in terminals:
+            self.append(terminal)
+        return self.accepts()
+
+    def truncate(self, length: int) -> None:
+        """Keeps only the first `length` terminals, dropping the cells of the rest"""
+        if length < 0:
+            raise ValueError(f"length must be positive, got {length}")
+        del self.string[length:]
+        del self._by_start[length:]
+        del self._by_end[length + 1 :]
+        for i, cells in enumerate(self._by_start):
+            del cells[length - i :]
+
+    def accepts(self) -> bool:
+        """True if the grammar produces the current string"""
+        if not self.string:
+            return produces_empty(self.compiled.grammar)
+        return bool(self._by_start[0][-1] & self._start_bit)
+
+    @property
+    def table(self) -> ProcessTable:
+        """CYK table of the current string, as `solve` returns it"""
+        n = len(self.string)
+        return [
+            [self.compiled.variables_of(self._by_start[i][l]) for i in range(n - l)]
+            for l in range(n)
+        ]
+
+
+def fill_matrix_table(compiled: CompiledGrammar, string: InputString) -> List[List[int]]:
+    return list(iter_matrix_diagonals(compiled, string))
+
+
+def iter_matrix_diagonals(compiled: CompiledGrammar, string: InputString) -> Iterator[List[int]]:
+    """Same rows as `iter_bitset_diagonals`, computed one diagonal at a time with NumPy.
+
+    Every variable B has two boolean matrices packed in uint64 words, indexed by
+    string positions: by_start[B][i] has bit m set when B produces string[i:m], and
+    by_end[B][j] has bit m set when B produces string[m:j]. For a rule A -> BC, the
+    cells (i, i + l) of a whole diagonal are the diagonal of the boolean product of
+    both matrices, any(by_start[B][i] & by_end[C][i + l]), which is a single
+    vectorized AND over contiguous rows.
+    """
+    n = len(string)
+    n_variables = len(compiled.variables)
+    words = n // 64 + 1
+    by_start = np.zeros((n_variables, n + 1, words), dtype=np.uint64)
+    by_end = np.zeros((n_variables, n + 1, words), dtype=np.uint64)
+    produces = [False] * n_variables
+    first_row = [compiled.terminal_masks.get(s[0], 0) for s in string]
+
+    # Cell masks are a single product with the bit of every variable while they fit in an int64
+    bits = np.left_shift(1, np.arange(n_variables, dtype=np.int64)) if n_variables < 63 else None
+
+    def add_cells(length: int, hits: np.ndarray) -> List[int]:
+        masks = [0] * (n - length + 1) if bits is None else (bits @ hits).tolist()
+        for a in np.flatnonzero(hits.any(axis=1)).tolist():
+            produces[a] = True
+            starts = np.flatnonzero(hits[a])
+            ends = starts + length
+            by_start[a, starts, ends >> 6] |= np.left_shift(np.uint64(1), (ends & 63).astype(np.uint64))
+            by_end[a, ends, starts >> 6] |= np.left_shift(np.uint64(1), (starts & 63).astype(np.uint64))
+            if bits is None:
+                for i in starts.tolist():
+                    masks[i] |= 1 << a
+        return masks
+
+    first_diagonal = np.array(
+        [[mask >> a & 1 for mask in first_row] for a in range(n_variables)], dtype=bool
+    ).reshape(n_variables, n)
+    add_cells(1, first_diagonal)
+    yield first_row
+    for length in range(2, n + 1):
+        count = n - length + 1
+        hits = np.zeros((n_variables, count), dtype=bool)
+        for b, rules in enumerate(compiled.binary_rules):
+            if not rules or not produces[b]:
+                continue
+            left = by_start[b, :count]
+            for c, mask in rules:
+                if not produces[c]:
                     continue
+                produced = (left & by_end[c, length : length + count]).any(axis=1)
+                while mask:
+                    low_bit = mask & -mask
+                    mask ^= low_bit
+                    hits[low_bit.bit_length() - 1] |= produced
+        yield add_cells(length, hits)
 
-                cartesian_product = cartesian_product_productions(left_prod, right_prod)
-                for candidate_production in cartesian_product:
-                    for variable, productions in G.productions.items():
-                        for production in productions:
-                            if candidate_production == production:
-                                explanation += f"\tAdding {variable} because produces {''.join(str(s) for s in candidate_production)}\n"
-                                table[j - 1][i].add(variable)
-                explanation += "\n"
-        explanation += "\n"
-    result = G.start in table[-1][0]
-    ans = Answer(string, G, result, table, explanation)
+
+ParseTree = Tuple[Any, ...]
+
+
+class ParseForest:
+    """Shared packed forest of the derivations of a string from the start variable.
+
+    Built top-down from a bitset table, so it only keeps the cells and variables
+    taking part in some derivation. The back-pointers of a cell are a single
+    int64 array with one entry `split * len(rules) + rule` per way of deriving one
+    of its variables, where rule indexes `rules` (A, B, C ids of A -> BC) and split
+    is the length of the part derived by B. Subtrees are shared between all the
+    derivations using them, so the forest stays O(n³) even when the number of
+    trees is exponential.
+
+    Arguments:
+        compiled (CompiledGrammar): grammar of the table.
+        string (InputString): string parsed.
+        masks (List[List[int]]): bitset table, masks[l - 1][i] being the cell of
+            string[i : i + l].
+    """
+
+    def __init__(self, compiled: CompiledGrammar, string: InputString, masks: List[List[int]]):
+        self.compiled = compiled
+        self.string = string
+        self.rules: List[Tuple[int, int, int]] = list()
+        rules_of: Dict[Tuple[int, int], List[int]] = dict()
+        for b, pairs in enumerate(compiled.binary_rules):
+            for c, mask in pairs:
+                ids = rules_of.setdefault((b, c), [])
+                for a in range(len(compiled.variables)):
+                    if mask >> a & 1:
+                        ids.append(len(self.rules))
+                        self.rules.append((a, b, c))
+
+        n = len(string)
+        start = compiled.variable_ids[compiled.grammar.start]
+        # needed[l - 1][i]: variables of the cell of string[i : i + l] used by a derivation
+        self.needed: List[List[int]] = [[0] * (n - l) for l in range(n)]
+        # Back-pointers of the cell of string[i : i + l], keyed by (l - 1) * n + i
+        self.pointers: Dict[int, array] = dict()
+        if n and masks[-1][0] >> start & 1:
+            self.needed[-1][0] = 1 << start
+        n_rules = len(self.rules)
+        for l in range(n, 1, -1):
+            for i, needed in enumerate(self.needed[l - 1]):
+                if not needed:
+                    continue
+                cell_pointers = array("q")
+                for k in range(1, l):
+                    left, right = masks[k - 1][i], masks[l - k - 1][i + k]
+                    while left:
+                        low_bit = left & -left
+                        left ^= low_bit
+                        b = low_bit.bit_length() - 1
+                        if not right & compiled.right_masks[b]:
+                            continue
+                        for c, mask in compiled.binary_rules[b]:
+                            if not (right >> c & 1 and mask & needed):
+                                continue
+                            for rule in rules_of[(b, c)]:
+                                if needed >> self.rules[rule][0] & 1:
+                                    cell_pointers.append(k * n_rules + rule)
+                            self.needed[k - 1][i] |= low_bit
+                            self.needed[l - k - 1][i + k] |= 1 << c
+                self.pointers[(l - 1) * n + i] = cell_pointers
+
+    def __len__(self) -> int:
+        """Number of back-pointers stored"""
+        return sum(len(cell_pointers) for cell_pointers in self.pointers.values())
+
+    def count(self) -> int:
+        """Exact number of derivations of the string, more than 1 if it is ambiguous"""
+        n = len(self.string)
+        if not n or not self.needed[-1][0]:
+            return 0
+        n_rules = len(self.rules)
+        # counts[(l - 1) * n + i][a]: derivations of string[i : i + l] from variable a,
+        # only for the cells of the forest
+        counts: Dict[int, Dict[int, int]] = dict()
+        for i, needed in enumerate(self.needed[0]):
+            if needed:
+                counts[i] = {
+                    a: 1 for a in range(len(self.compiled.variables)) if needed >> a & 1
+                }
+        # Keys grow with the length, so the parts of a cell are counted before it
+        for key in sorted(self.pointers):
+            l, i = key // n + 1, key % n
+            cell_counts: Dict[int, int] = dict()
+            for packed in self.pointers[key]:
+                k, rule = divmod(packed, n_rules)
+                a, b, c = self.rules[rule]
+                cell_counts[a] = (
+                    cell_counts.get(a, 0)
+                    + counts[(k - 1) * n + i][b] * counts[(l - k - 1) * n + i + k][c]
+                )
+            counts[key] = cell_counts
+        return counts[(n - 1) * n].get(self.compiled.variable_ids[self.compiled.grammar.start], 0)
+
+    def trees(self) -> Iterator[ParseTree]:
+        """Lazily yields every derivation tree, as nested tuples: (A, left, right) for
+        a rule A -> BC and (A, a) for a rule A -> a"""
+        n = len(self.string)
+        if not n or not self.needed[-1][0]:
+            return
+        # Backtracking over the leftmost derivations with an explicit stack, so deep
+        # trees don't hit the recursion limit. A frame is [i, l, a, rest, splits, choice]:
+        # the variable a deriving string[i : i + l], the nodes still to expand after it
+        # as a linked list of ((i, l, a), rest) and, for l > 1, its (k, b, c) splits
+        frames: List[List[Any]] = list()
+        pending: Any = ((0, n, self.compiled.variable_ids[self.compiled.grammar.start]), None)
+        while True:
+            while pending is not None:
+                (i, l, a), rest = pending
+                if l == 1:
+                    frames.append([i, l, a, rest, None, 0])
+                    pending = rest
+                    continue
+                splits = self._splits(i, l, a)
+                if not splits:
+                    break
+                frames.append([i, l, a, rest, splits, 0])
+                k, b, c = splits[0]
+                pending = ((i, k, b), ((i + k, l - k, c), rest))
+            else:
+                yield self._build_tree(frames)
+            while frames:
+                frame = frames[-1]
+                i, l, a, rest, splits, choice = frame
+                if splits is not None and choice + 1 < len(splits):
+                    frame[5] = choice + 1
+                    k, b, c = splits[choice + 1]
+                    pending = ((i, k, b), ((i + k, l - k, c), rest))
+                    break
+                frames.pop()
+            else:
+                return
+
+    def _splits(self, i: int, l: int, a: int) -> List[Tuple[int, int, int]]:
+        n_rules = len(self.rules)
+        splits = list()
+        for packed in self.pointers[(l - 1) * len(self.string) + i]:
+            k, rule = divmod(packed, n_rules)
+            rule_a, b, c = self.rules[rule]
+            if rule_a == a:
+                splits.append((k, b, c))
+        return splits
+
+    def _build_tree(self, frames: List[List[Any]]) -> ParseTree:
+        # Frames are in preorder, so backwards the two subtrees of a node are on top
+        subtrees: List[ParseTree] = list()
+        for i, _, a, _, splits, _ in reversed(frames):
+            variable = self.compiled.variables[a]
+            if splits is None:
+                subtrees.append((variable, self.string[i][0]))
+            else:
+                left = subtrees.pop()
+                subtrees.append((variable, left, subtrees.pop()))
+        return subtrees[0]
+
+
+def prune_grammar(G: Grammar) -> Grammar:
+    """Grammar without its useless variables: the ones producing no string of
+    terminals and the ones the start variable never reaches. It accepts the same
+    strings as G, and the start variable is kept even when it produces nothing."""
+    productive: Set[Variable] = set()
+    changed = True
+    while changed:
+        changed = False
+        for variable, productions in G.productions.items():
+            if variable not in productive and any(
+                all(isinstance(s, Terminal) or s in productive for s in production)
+                for production in productions
+            ):
+                productive.add(variable)
+                changed = True
+
+    useful: Dict[Variable, Set[Production]] = {
+        variable: {
+            production
+            for production in G.productions[variable]
+            if all(isinstance(s, Terminal) or s in productive for s in production)
+        }
+        for variable in productive
+    }
+    reachable = {G.start}
+    pending = [G.start] if G.start in useful else []
+    while pending:
+        for production in useful[pending.pop()]:
+            for symbol in production:
+                if isinstance(symbol, Variable) and symbol not in reachable:
+                    reachable.add(symbol)
+                    pending.append(symbol)
+
+    productions = {v: p for v, p in useful.items() if v in reachable}
+    terminals = {
+        s for alternatives in productions.values() for p in alternatives for s in p
+        if isinstance(s, Terminal)
+    }
+    return Grammar(start=G.start, variables=reachable, terminals=terminals, productions=productions)
+
+
+@dataclass
+class CNFMetrics:
+    """Size of a grammar before and after `to_cnf`. The cost of CYK grows with the
+    number of rules, so `blowup` tells how much the conversion made it slower.
+
+    Arguments:
+        variables_before (int): variables of the input grammar.
+        rules_before (int): alternatives of the input grammar.
+        variables_after (int): variables of the grammar in CNF.
+        rules_after (int): alternatives of the grammar in CNF.
+        order (Tuple[str, ...]): steps applied, in order.
+    """
+
+    variables_before: int
+    rules_before: int
+    variables_after: int
+    rules_after: int
+    order: Tuple[str, ...]
+
+    @property
+    def blowup(self) -> float:
+        return self.rules_after / max(self.rules_before, 1)
+
+
+class _TooManyVariants(Exception):
+    pass
+
+
+def grammar_size(G: Grammar) -> Tuple[int, int]:
+    """Number of variables and of rules (alternatives) of the grammar"""
+    variables = set(G.variables) | set(G.productions) | {G.start}
+    return len(variables), sum(len(productions) for productions in G.productions.values())
+
+
+def is_cnf(G: Grammar) -> bool:
+    """True if every rule is A -> BC or A -> a, besides an empty rule for the start
+    variable when it appears on no right hand side"""
+    start_on_right = any(
+        isinstance(s, Variable) and s == G.start
+        for productions in G.productions.values()
+        for production in productions
+        for s in production
+    )
+    for variable, productions in G.productions.items():
+        for production in productions:
+            if len(production) == 1 and isinstance(production[0], Terminal):
+                continue
+            if len(production) == 2 and all(isinstance(s, Variable) for s in production):
+                continue
+            if not production and variable == G.start and not start_on_right:
+                continue
+            return False
+    return True
+
+
+def produces_empty(G: Grammar) -> bool:
+    """True if the grammar in Chomsky normal form G produces the empty string, which
+    only a rule S -> ε of its start variable can do. The CYK table of the empty
+    string has no cell to tell it"""
+    return () in G.productions.get(G.start, ())
+
+
+def to_cnf(G: Grammar) -> Tuple[Grammar, CNFMetrics]:
+    """Grammar in Chomsky normal form producing the same strings as G.
+
+    Useless variables are removed, then the START step adds a new start variable
+    if the old one is nullable and used on a right hand side, and the TERM, BIN,
+    DEL and UNIT steps are applied in every order where DEL comes before UNIT.
+    The smallest result is kept, once variables with the same alternatives are
+    merged. New variables get unused one character names: the free uppercase
+    letters, then other uppercase letters from unicode.
+    """
+    pruned = prune_grammar(G)
+    best: Optional[Tuple[Grammar, Tuple[str, ...]]] = None
+    for order in permutations(CNF_STEPS):
+        if order.index("DEL") > order.index("UNIT"):
+            continue
+        try:
+            candidate = _convert_to_cnf(pruned, order)
+        except _TooManyVariants:
+            continue
+        if best is None or grammar_size(candidate)[::-1] < grammar_size(best[0])[::-1]:
+            best = (candidate, order)
+    assert best is not None
+    converted, order = best
+    if converted.start != pruned.start:
+        order = ("START",) + order
+    before, after = grammar_size(G), grammar_size(converted)
+    return converted, CNFMetrics(before[0], before[1], after[0], after[1], order)
+
+
+def _production_key(production: Production) -> str:
+    return "".join(map(str, production))
+
+
+def _fresh_variables(G: Grammar) -> Iterator[Variable]:
+    used = {str(s) for s in chain(G.variables, G.terminals, G.productions)}
+    used.update(str(s) for p in G.productions.values() for production in p for s in production)
+    for code in chain(range(ord("A"), ord("Z") + 1), range(0x80, sys.maxunicode + 1)):
+        name = chr(code)
+        if name.isupper() and name not in used:
+            yield Variable(name)
+
+
+def _nullable_variables(productions: Dict[Variable, Set[Production]]) -> Set[Variable]:
+    nullable: Set[Variable] = set()
+    changed = True
+    while changed:
+        changed = False
+        for variable, alternatives in productions.items():
+            if variable not in nullable and any(
+                all(isinstance(s, Variable) and s in nullable for s in production)
+                for production in alternatives
+            ):
+                nullable.add(variable)
+                changed = True
+    return nullable
+
+
+def _convert_to_cnf(G: Grammar, order: Tuple[str, ...]) -> Grammar:
+    fresh = _fresh_variables(G)
+    start = G.start
+    productions = {v: set(p) for v, p in G.productions.items()}
+    if start in _nullable_variables(productions) and any(
+        isinstance(s, Variable) and s == start
+        for p in productions.values()
+        for production in p
+        for s in production
+    ):
+        start = next(fresh)
+        productions[start] = {(G.start,)}
+    steps = {"TERM": _cnf_term, "BIN": _cnf_bin, "DEL": _cnf_del, "UNIT": _cnf_unit}
+    for step in order:
+        productions = steps[step](start, productions, fresh)
+    productions = _merge_equal_variables(start, productions)
+    return prune_grammar(
+        Grammar(
+            start=start,
+            variables=set(productions) | {start},
+            terminals=set(G.terminals),
+            productions=productions,
+        )
+    )
+
+
+def _single_productions(
+    start: Variable, productions: Dict[Variable, Set[Production]]
+) -> Dict[Production, Variable]:
+    """Variables other than the start one with a single alternative, by alternative"""
+    single: Dict[Production, Variable] = dict()
+    for variable in sorted(productions, key=str):
+        if variable != start and len(productions[variable]) == 1:
+            single.setdefault(next(iter(productions[variable])), variable)
+    return single
+
+
+def _cnf_term(
+    start: Variable, productions: Dict[Variable, Set[Production]], fresh: Iterator[Variable]
+) -> Dict[Variable, Set[Production]]:
+    """Replaces the terminals of rules longer than 1 by variables producing them"""
+    producing = _single_productions(start, productions)
+    result: Dict[Variable, Set[Production]] = dict()
+    for variable in sorted(productions, key=str):
+        alternatives = result.setdefault(variable, set())
+        for production in sorted(productions[variable], key=_production_key):
+            if len(production) > 1:
+                replaced: List[Union[Terminal, Variable]] = list()
+                for s in production:
+                    if isinstance(s, Terminal):
+                        if (s,) not in producing:
+                            producing[(s,)] = next(fresh)
+                            result[producing[(s,)]] = {(s,)}
+                        replaced.append(producing[(s,)])
+                    else:
+                        replaced.append(s)
+                production = tuple(replaced)
+            alternatives.add(production)
+    return result
+
+
+def _cnf_bin(
+    start: Variable, productions: Dict[Variable, Set[Production]], fresh: Iterator[Variable]
+) -> Dict[Variable, Set[Production]]:
+    """Splits rules longer than 2 in chains of rules of length 2, the rules ending
+    with the same symbols sharing the end of their chains"""
+    producing = _single_productions(start, productions)
+    result: Dict[Variable, Set[Production]] = {v: set() for v in productions}
+
+    def variable_of(suffix: Production) -> Variable:
+        if suffix not in producing:
+            rest = suffix if len(suffix) == 2 else (suffix[0], variable_of(suffix[1:]))
+            producing[suffix] = next(fresh)
+            result[producing[suffix]] = {rest}
+        return producing[suffix]
+
+    for variable in sorted(productions, key=str):
+        for production in sorted(productions[variable], key=_production_key):
+            if len(production) > 2:
+                production = (production[0], variable_of(production[1:]))
+            result[variable].add(production)
+    return result
+
+
+def _cnf_del(
+    start: Variable, productions: Dict[Variable, Set[Production]], fresh: Iterator[Variable]
+) -> Dict[Variable, Set[Production]]:
+    """Removes the empty rules, adding every rule with its nullable symbols left out"""
+    nullable = _nullable_variables(productions)
+    result: Dict[Variable, Set[Production]] = dict()
+    for variable, alternatives in productions.items():
+        result[variable] = set()
+        for production in alternatives:
+            choices = [
+                ((s,), ()) if isinstance(s, Variable) and s in nullable else ((s,),)
+                for s in production
+            ]
+            if sum(len(c) > 1 for c in choices) > MAX_NULLABLE_SYMBOLS:
+                raise _TooManyVariants(production)
+            for variant in product(*choices):
+                kept = tuple(s for part in variant for s in part)
+                if kept:
+                    result[variable].add(kept)
+    if start in nullable:
+        result.setdefault(start, set()).add(())
+    return result
+
+
+def _cnf_unit(
+    start: Variable, productions: Dict[Variable, Set[Production]], fresh: Iterator[Variable]
+) -> Dict[Variable, Set[Production]]:
+    """Replaces the rules A -> B by the other alternatives of B"""
+
+    def is_unit(production: Production) -> bool:
+        return len(production) == 1 and isinstance(production[0], Variable)
+
+    result: Dict[Variable, Set[Production]] = dict()
+    for variable in productions:
+        closure = {variable}
+        pending = [variable]
+        while pending:
+            for production in productions.get(pending.pop(), ()):
+                if is_unit(production) and production[0] not in closure:
+                    closure.add(production[0])
+                    pending.append(production[0])
+        result[variable] = {
+            production
+            for v in closure
+            for production in productions.get(v, ())
+            if not is_unit(production) and (production or v == variable)
+        }
+    return result
+
+
+def _merge_equal_variables(
+    start: Variable, productions: Dict[Variable, Set[Production]]
+) -> Dict[Variable, Set[Production]]:
+    """Replaces the variables with the same alternatives by a single one"""
+    while True:
+        representative: Dict[FrozenSet[Production], Variable] = dict()
+        replace: Dict[Variable, Variable] = dict()
+        for variable in sorted(productions, key=str):
+            if variable == start:
+                continue
+            key = frozenset(productions[variable])
+            if key in representative:
+                replace[variable] = representative[key]
+            else:
+                representative[key] = variable
+        if not replace:
+            return productions
+        productions = {
+            variable: {
+                tuple(replace.get(s, s) if isinstance(s, Variable) else s for s in production)
+                for production in alternatives
+            }
+            for variable, alternatives in productions.items()
+            if variable not in replace
+        }
+
+
+def canonical_grammar(
+    start: str,
+    variables: Iterable[str],
+    terminals: Iterable[str],
+    productions: Dict[str, Iterable[str]],
+) -> str:
+    """Text of a grammar with its variables, terminals and alternatives sorted,
+    so equal grammars get the same text whatever the order they were written in"""
+    lines = [start, " ".join(sorted(variables)), " ".join(sorted(terminals))]
+    for variable in sorted(productions):
+        lines.append(f"{variable} -> {' | '.join(sorted(set(productions[variable])))}")
+    return "\n".join(lines)
+
+
+def grammar_hash(G: Grammar) -> str:
+    productions = {
+        str(variable): ["".join(map(str, production)) for production in alternatives]
+        for variable, alternatives in G.productions.items()
+    }
+    text = canonical_grammar(str(G.start), map(str, G.variables), map(str, G.terminals), productions)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class GrammarCache:
+    """LRU cache of compiled grammars keyed by the hash of their canonical text.
+
+    `compile_text` also maps the hashes of input texts to the key of their grammar,
+    and the hash of a grammar converted by `to_cnf` is mapped to the key of the
+    grammar it comes from, in separate LRUs of the same capacity. So a grammar
+    takes a single entry and a single hit or miss whichever way it is looked up,
+    and compiling a converted grammar again gives back its `cnf_metrics`.
+
+    Arguments:
+        capacity (int): number of grammars kept, the least recently used one is
+            evicted first. 0 disables the cache.
+    """
+
+    def __init__(self, capacity: int = 128):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._grammars: "OrderedDict[str, CompiledGrammar]" = OrderedDict()
+        # Hash of an input text -> key of its grammar in _grammars
+        self._text_keys: "OrderedDict[str, str]" = OrderedDict()
+        # Key of a grammar converted to CNF -> key of the grammar it comes from
+        self._converted_keys: "OrderedDict[str, str]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._grammars)
+
+    def get(self, key: str) -> Optional[CompiledGrammar]:
+        compiled = self._grammars.get(key)
+        if compiled is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._grammars.move_to_end(key)
+        return compiled
+
+    def put(self, key: str, compiled: CompiledGrammar) -> None:
+        self._grammars[key] = compiled
+        self._grammars.move_to_end(key)
+        self._evict()
+
+    def compile(self, G: Grammar, pruned: bool = False) -> CompiledGrammar:
+        """Compiled G, or compiled `prune_grammar(G)` if pruned. Grammars not in
+        Chomsky normal form are converted with `to_cnf` first"""
+        key = grammar_hash(G) + ("/pruned" if pruned else "")
+        return self._compile(self._alias_of(self._converted_keys, key) or key, G, pruned)
+
+    def compile_text(self, text_key: str, parse: Callable[[], Grammar]) -> CompiledGrammar:
+        """Compiled grammar of an input text, keyed by a hash of the text so `parse`
+        only builds the grammar the first time it is seen"""
+        key = self._alias_of(self._text_keys, text_key)
+        if key is not None:
+            return self.get(key)
+        G = parse()
+        key = grammar_hash(G)
+        self._add_alias(self._text_keys, text_key, key)
+        return self._compile(key, G, False)
+
+    def _compile(self, key: str, G: Grammar, pruned: bool) -> CompiledGrammar:
+        compiled = self.get(key)
+        if compiled is None:
+            with profiler.phase("cyk.compile"):
+                metrics = None
+                if not is_cnf(G):
+                    G, metrics = to_cnf(G)
+                    logger.info(f"Converted grammar to CNF: {metrics}")
+                compiled = CompiledGrammar(prune_grammar(G) if pruned else G, metrics)
+            self.put(key, compiled)
+            if metrics is not None:
+                converted_key = grammar_hash(compiled.grammar) + ("/pruned" if pruned else "")
+                self._add_alias(self._converted_keys, converted_key, key)
+        return compiled
+
+    def cnf_metrics(self, G: Grammar) -> Optional["CNFMetrics"]:
+        """Metrics of the conversion giving G if it was converted to CNF by this cache,
+        without counting a hit or a miss"""
+        key = self._alias_of(self._converted_keys, grammar_hash(G))
+        return self._grammars[key].cnf_metrics if key is not None else None
+
+    def _alias_of(self, aliases: "OrderedDict[str, str]", alias: str) -> Optional[str]:
+        """Key the alias stands for, None if it is unknown or its grammar was evicted"""
+        key = aliases.get(alias)
+        if key is None or key not in self._grammars:
+            return None
+        aliases.move_to_end(alias)
+        return key
+
+    def _add_alias(self, aliases: "OrderedDict[str, str]", alias: str, key: str) -> None:
+        aliases[alias] = key
+        aliases.move_to_end(alias)
+        self._evict()
+
+    def set_capacity(self, capacity: int) -> None:
+        self.capacity = capacity
+        self._evict()
+
+    def clear(self) -> None:
+        self._grammars.clear()
+        self._text_keys.clear()
+        self._converted_keys.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._grammars),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _evict(self) -> None:
+        while len(self._grammars) > self.capacity:
+            self._grammars.popitem(last=False)
+            self.evictions += 1
+        for aliases in (self._text_keys, self._converted_keys):
+            while len(aliases) > self.capacity:
+                aliases.popitem(last=False)
+
+
+grammar_cache = GrammarCache()
+
+
+@profiler.timed("cyk.solve")
+def solve(
+    G: Union[Grammar, CompiledGrammar],
+    string: InputString,
+    engine: str = "classic",
+    trace: bool = False,
+    forest: bool = False,
+) -> Answer:
+    """Runs CYK on the string
+    Args:
+        G (Union[Grammar, CompiledGrammar]): the grammar, or one already compiled so
+            it can be reused across strings. Grammars are compiled through
+            `grammar_cache`, and the ones not in Chomsky normal form are converted
+            with `to_cnf`: the table and the answer are then about the converted one
+        engine (str): "classic" compares every pair of variables against every
+            production, "bitset" fills the same table with bitmasks over a compiled
+            grammar and "matrix" computes it with boolean matrix products in NumPy,
+            which pays off on long strings
+        trace (bool): attach a CYKTrace to the answer, so its explanation can be read
+        forest (bool): attach the ParseForest of the string to the answer
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {ENGINES}, got {engine}")
+    compiled = G if isinstance(G, CompiledGrammar) else None
+    G = G.grammar if isinstance(G, CompiledGrammar) else G
+    if compiled is None and (engine != "classic" or not is_cnf(G)):
+        compiled = grammar_cache.compile(G)
+    # The grammar actually solved, converted to CNF if needed
+    G = compiled.grammar if compiled is not None else G
+    with profiler.phase("cyk.fill_table"):
+        if engine != "classic":
+            fill_table = fill_bitset_table if engine == "bitset" else fill_matrix_table
+            masks = fill_table(compiled, string)
+            table = [[compiled.variables_of(mask) for mask in row] for row in masks]
+        else:
+            masks = None
+            table = fill_classic_table(string, G)
+    profiler.count("cyk.cells", len(string) * (len(string) + 1) // 2)
+    result = G.start in table[-1][0] if string else produces_empty(G)
+    parse_forest = None
+    if forest:
+        compiled = compiled or grammar_cache.compile(G)
+        if masks is None:
+            masks = [
+                [sum(1 << compiled.variable_ids[v] for v in cell) for cell in row] for row in table
+            ]
+        parse_forest = ParseForest(compiled, string, masks)
+    ans = Answer(
+        string,
+        G,
+        result,
+        table,
+        CYKTrace(G, string, table) if trace else None,
+        parse_forest,
+        compiled.cnf_metrics if compiled is not None else grammar_cache.cnf_metrics(G),
+    )
     return ans
 
 
+def recognize(G: Grammar, string: InputString, engine: str = "bitset") -> bool:
+    """True if G produces the string, without building the CYK table of `solve`.
+
+    Useless variables are pruned from the grammar first, and the table is filled
+    one diagonal (substring length) at a time, stopping as soon as the remaining
+    diagonals are known to be empty. A single empty diagonal is not enough for
+    that, but once the diagonals of lengths s to 2s - 1 are all empty, so are the
+    longer ones: the parse tree of a longer substring always has a subtree whose
+    length is between s and 2s - 1.
+    Args:
+        engine (str): as in `solve`. The classic engine has no early exit and
+            only benefits from the pruned grammar
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {ENGINES}, got {engine}")
+    if engine == "classic":
+        return solve(grammar_cache.compile(G, pruned=True).grammar, string).result
+    compiled = grammar_cache.compile(G, pruned=True)
+    if not string:
+        return produces_empty(compiled.grammar)
+    if not compiled.grammar.productions:
+        return False
+    diagonals = (
+        iter_bitset_diagonals(compiled, string)
+        if engine == "bitset"
+        else iter_matrix_diagonals(compiled, string)
+    )
+    first_empty = 0
+    for length, row in enumerate(diagonals, start=1):
+        profiler.count("cyk.cells", len(row))
+        if any(row):
+            first_empty = 0
+        elif not first_empty:
+            first_empty = length
+        if first_empty and length >= 2 * first_empty - 1:
+            return False
+    return bool(row[0] >> compiled.variable_ids[compiled.grammar.start] & 1)
+
+
+class Membership(NamedTuple):
+    """Compact answer of `solve_many`
+
+    Arguments:
+        string (InputString): string checked.
+        result (bool): True if the string is produced by the grammar.
+        table (Optional[ProcessTable]): CYK table, only when asked for.
+    """
+
+    string: InputString
+    result: bool
+    table: Optional[ProcessTable] = None
+
+
+def solve_many(
+    G: Union[Grammar, CompiledGrammar],
+    strings: Iterable[InputString],
+    with_table: bool = False,
+    memo: Optional[SpanMemo] = None,
+) -> List[Membership]:
+    """Checks many strings against one grammar with the bitset engine.
+
+    The grammar is compiled once, and the cell of every substring is kept in a
+    bounded memo shared by all the strings, so substrings they have in common are
+    only solved once.
+    Args:
+        with_table (bool): include the CYK table of every string
+        memo (Optional[SpanMemo]): memo to use, a new one with the default
+            capacity otherwise. It must only be shared between calls with the
+            same grammar
+    """
+    compiled = G if isinstance(G, CompiledGrammar) else grammar_cache.compile(G)
+    start_bit = 1 << compiled.variable_ids[compiled.grammar.start]
+    memo = SpanMemo() if memo is None else memo
+    answers: List[Membership] = list()
+    for string in strings:
+        mask = memo.get("".join(str(s[0]) for s in string)) if not with_table else None
+        table: Optional[ProcessTable] = None
+        if not string:
+            # No table cell to read, as in `recognize`
+            table = [] if with_table else None
+            answers.append(Membership(string, produces_empty(compiled.grammar), table))
+            continue
+        if mask is None:
+            masks = fill_bitset_table(compiled, string, memo)
+            mask = masks[-1][0]
+            if with_table:
+                table = [[compiled.variables_of(cell) for cell in row] for row in masks]
+        answers.append(Membership(string, bool(mask & start_bit), table))
+    return answers
+
+
+def _solve_case(
+    case: Tuple[Grammar, InputString], engine: str = "classic", trace: bool = False
+) -> Answer:
+    return solve(*case, engine=engine, trace=trace)
+
+
+def solve_batch(
+    cases: Iterable[Tuple[Grammar, InputString]],
+    workers: Optional[int] = 1,
+    chunk_size: int = 16,
+    engine: str = "classic",
+    trace: bool = False,
+) -> Iterator[Answer]:
+    """Solves independent (grammar, string) cases, yielding the answers in input order.
+    With workers != 1 the cases are spread over a process pool (None or 0 for one
+    process per core), chunk_size cases at a time.
+    """
+    return ordered_map(partial(_solve_case, engine=engine, trace=trace), cases, workers, chunk_size)
+
+
 def del_extra_spaces(string: str) -> str:
     return re.sub(" +", " ", string)
 
@@ -242,7 +1421,8 @@ def parse_productions(
         product = list(map(str.strip, raw_production[1].split("|")))
         for prod in product:
             single_production: List[Union[Terminal, Variable]] = list()
-            for s in prod:
+            # ε stands for the empty string
+            for s in prod.replace("ε", ""):
                 if s in variables:
                     single_production.append(Variable(s))
                 elif s in terminals:
@@ -254,30 +1434,57 @@ def parse_productions(
     return productions
 
 
-def parse_input(lines: List[str], n: int) -> Iterator[Tuple[Grammar, InputString]]:
+def split_productions(lines: List[str]) -> Dict[str, Set[str]]:
+    """Alternatives of every variable, as text"""
+    productions: Dict[str, Set[str]] = dict()
+    for line_prod in lines:
+        raw_production = line_prod.strip().split("->")
+        alternatives = productions.setdefault(raw_production[0].strip(), set())
+        alternatives.update(map(str.strip, raw_production[1].split("|")))
+    return productions
+
+
+def parse_input(
+    lines: List[str], n: int, cache: Optional[GrammarCache] = None
+) -> Iterator[Tuple[Grammar, InputString]]:
     """
     Parse input file.
     :param input_file: input file name
-    :return: parsed input
+    :param cache: compiled grammars to reuse, `grammar_cache` by default. A grammar
+        already in the cache is not parsed again
+    :return: parsed input, the grammars compiled by `GrammarCache.compile_text` so the
+        ones not in Chomsky normal form come converted
     """
+    cache = grammar_cache if cache is None else cache
     i = 0
     for _ in range(n):
-        string: InputString = list(map(lambda x: (Terminal(x),), lines[i].strip()))
-        start_var: Variable = Variable(lines[i + 1])
-        variables: Set[Variable] = set(map(Variable, lines[i + 2].strip().split()))
-        terminals: Set[Terminal] = set(map(Terminal, lines[i + 3].strip().split()))
-        start = i + 4
-        stop = start + len(variables)
-        productions = parse_productions(lines[start:stop], variables, terminals)
-
-        G = Grammar(
-            start=start_var,
-            variables=variables,
-            terminals=terminals,
-            productions=productions,
-        )
-        i = i + stop
-        yield G, string
+        with profiler.phase("cyk.parse"):
+            string: InputString = list(map(lambda x: (Terminal(x),), lines[i].strip()))
+            variable_names = lines[i + 2].strip().split()
+            start = i + 4
+            stop = start + len(set(variable_names))
+            text_key = hashlib.sha1(
+                canonical_grammar(
+                    lines[i + 1].strip(),
+                    variable_names,
+                    lines[i + 3].strip().split(),
+                    split_productions(lines[start:stop]),
+                ).encode()
+            ).hexdigest()
+
+            def parse_grammar() -> Grammar:
+                variables: Set[Variable] = set(map(Variable, variable_names))
+                terminals: Set[Terminal] = set(map(Terminal, lines[i + 3].strip().split()))
+                return Grammar(
+                    start=Variable(lines[i + 1]),
+                    variables=variables,
+                    terminals=terminals,
+                    productions=parse_productions(lines[start:stop], variables, terminals),
+                )
+
+            compiled = cache.compile_text(text_key, parse_grammar)
+            i = stop
+        yield compiled.grammar, string
 
 
 def main(args: Dict[str, Any]) -> List[Answer]:
@@ -286,10 +1493,11 @@ def main(args: Dict[str, Any]) -> List[Answer]:
     n = int(lines[0])
     lines = list(map(del_extra_spaces, lines[1:]))
     answers: List[Answer] = list()
-    for G, string in parse_input(lines, n):
-        ans = solve(G, string)
+    cases = parse_input(lines, n)
+    for ans in solve_batch(cases, args["workers"], args["chunk_size"], args["engine"], args["trace"]):
         answers.append(ans)
-        print(ans.explanation)
+        if args["trace"]:
+            print(ans.explanation)
         for r in ans.table:
             print(r)
     return answers
@@ -306,5 +1514,35 @@ if __name__ == "__main__":
         type=str,
         default="cyk_output.txt",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="processes solving test cases in parallel, 0 for one per core",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--chunk-size", help="test cases sent to a worker at once", type=int, default=16,
+    )
+    parser.add_argument(
+        "-e", "--engine", help="CYK engine", choices=ENGINES, default="classic",
+    )
+    parser.add_argument(
+        "-t", "--trace", help="print the step by step explanation", action="store_true",
+    )
+    parser.add_argument(
+        "--profile",
+        help="print the time of every phase and the work done to stderr, with --workers 1",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        help="with --profile, also trace the peak memory of every phase",
+        action="store_true",
+    )
     args = parser.parse_args()
+    if args.profile:
+        profiler.enable(memory=args.profile_memory)
     main(vars(args))
+    if args.profile:
+        print(profiler.report(), file=sys.stderr)
@@ -1,30 +1,101 @@
-from typing import List, Dict, Set, Union
+from typing import Any, List, Dict, Optional, Sequence, Union
 from typing import Tuple
 from dataclasses import dataclass, field
-from pprint import pprint
-from copy import deepcopy
+from array import array
+import hashlib
+import numpy as np
+
+from profiling import profiler
+
+PARTITION_ALGORITHMS = ("moore", "hopcroft", "vectorized")
 
 
 @dataclass
 class FSM:
     S: Tuple[str, ...]
     R: Tuple[str, ...]
-    Q: Tuple[str, ...]
+    Q: Sequence[str]
     init_state: str
-    _transitions: Dict[str, Dict[str, Tuple[str, str]]] = field(default_factory=dict)
+    partition_algorithm: str = "moore"
     _inaccessible_states: List[str] = None
     _partitions: List[List[List[str]]] = None
+    _state_indices: Dict[str, int] = field(default=None, init=False, repr=False, compare=False)
+    _stimulus_index: Dict[str, int] = field(init=False, repr=False)
+    _output_index: Dict[str, int] = field(init=False, repr=False)
+    _next_state: array = field(default=None, repr=False)
+    _output: array = field(default=None, repr=False)
+    _init_index: int = field(default=None, repr=False, compare=False)
+    _successors: Tuple[array, array] = field(default=None, init=False, repr=False, compare=False)
+    _accessible: bytearray = field(default=None, init=False, repr=False, compare=False)
+    _canonical: bytes = field(default=None, init=False, repr=False, compare=False)
     """Finite State Machine
     Args:
       S (Tuple[str]): the input alphabet
       R (Tuple[str]): the output alphabet
-      Q (Tuple[str]): the set of states
+      Q (Sequence[str]): the set of states, a tuple unless loaded by `storage`
       init_state (str): the initial state
+      partition_algorithm (str): "moore" to refine every block on each round
+        (keeps every intermediate partition), "vectorized" for the same rounds
+        computed with NumPy or "hopcroft" for the O(n·k·log n) refinement
+        (keeps only the initial and final partitions)
+
+    States, stimuli and outputs are interned to their index in Q, S and R. The
+    transition of state q under stimulus s is stored at q * |S| + s of the int32
+    arrays `_next_state` and `_output`, with -1 for a missing transition. Both can
+    be passed in to build a machine from an existing table without copying it,
+    including memoryviews over a mapped file. The index of the states is built on
+    first use; `_init_index` can be passed in with the index of the initial state,
+    so running the machine from it does not need the index of the states.
+    Everything derived from the table (successor index, accessible states,
+    partitions and canonical form) is cached and dropped by `add_transition`.
     """
 
     def __post_init__(self) -> None:
-        for q in self.Q:
-            self._transitions[q] = dict()
+        if self.partition_algorithm not in PARTITION_ALGORITHMS:
+            raise ValueError(
+                f"partition_algorithm must be one of {PARTITION_ALGORITHMS}, got {self.partition_algorithm}"
+            )
+        self._stimulus_index = {s: i for i, s in enumerate(self.S)}
+        self._output_index = {r: i for i, r in enumerate(self.R)}
+        if self._next_state is None:
+            self._next_state = array("i", [-1]) * (len(self.Q) * len(self.S))
+        if self._output is None:
+            self._output = array("i", [-1]) * (len(self.Q) * len(self.S))
+
+    @property
+    def _state_index(self) -> Dict[str, int]:
+        if self._state_indices is None:
+            self._state_indices = {q: i for i, q in enumerate(self.Q)}
+        return self._state_indices
+
+    @property
+    def _init_state_index(self) -> int:
+        if self._init_index is None or self.Q[self._init_index] != self.init_state:
+            self._init_index = self._state_index[self.init_state]
+        return self._init_index
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Tables mapped from a file are memoryviews, which cannot be pickled
+        state = dict(self.__dict__)
+        for name in ("_next_state", "_output"):
+            if isinstance(state[name], memoryview):
+                state[name] = array("i", state[name].tobytes())
+        state["Q"] = tuple(self.Q)
+        return state
+
+    @property
+    def _transitions(self) -> Dict[str, Dict[str, Tuple[str, str]]]:
+        """String view of the transition table, built on every access"""
+        transitions: Dict[str, Dict[str, Tuple[str, str]]] = dict()
+        k = len(self.S)
+        for q, state in enumerate(self.Q):
+            state_transitions: Dict[str, Tuple[str, str]] = dict()
+            for a, stimulus in enumerate(self.S):
+                dest = self._next_state[q * k + a]
+                if dest >= 0:
+                    state_transitions[stimulus] = (self.Q[dest], self.R[self._output[q * k + a]])
+            transitions[state] = state_transitions
+        return transitions
 
     @property
     def inaccessible_states(self) -> List[str]:
@@ -32,10 +103,31 @@ class FSM:
             self._inaccessible_states = self._get_inaccessible_states()
         return self._inaccessible_states
 
+    @property
+    def _accessible_states(self) -> bytearray:
+        if self._accessible is None:
+            with profiler.phase("fsm.reachability"):
+                self._accessible = self._get_accessible_states()
+        return self._accessible
+
+    @property
+    def _successor_index(self) -> Tuple[array, array]:
+        """Distinct successors of every state in CSR layout: the successors of state q
+        are targets[offsets[q]:offsets[q + 1]]"""
+        if self._successors is None:
+            self._successors = self._get_successor_index()
+        return self._successors
+
     @property
     def partitions(self) -> List[List[List[str]]]:
+        return self.compute_partitions()
+
+    def compute_partitions(self) -> List[List[List[str]]]:
+        """`partitions`, computed on the first call only. Calling it computes them
+        ahead of their first use, e.g. in a worker before sending the machine back"""
         if self._partitions is None:
-            self._partitions = self._partition()
+            with profiler.phase("fsm.partition"):
+                self._partitions = self._partition()
         return self._partitions
 
     @property
@@ -44,15 +136,15 @@ class FSM:
 
     def _check_valid_transition(self, src: str, dest: str, stimulus: str, output: str):
         results = {
-            'source state': (src, self.Q),
-            'destiny state': (dest, self.Q),
-            'stimulus': (stimulus, self.S),
-            'output': (output, self.R)
+            'source state': (src, self.Q, self._state_index),
+            'destiny state': (dest, self.Q, self._state_index),
+            'stimulus': (stimulus, self.S, self._stimulus_index),
+            'output': (output, self.R, self._output_index)
         }
         msg = ""
         valid_inputs: List[bool] = []
-        for name, (received, possible_values) in results.items():
-            valid = received in possible_values
+        for name, (received, possible_values, index) in results.items():
+            valid = received in index
             if not valid:
                 msg += f'{name} {received} not found in any of {possible_values}'
             valid_inputs.append(valid)
@@ -65,7 +157,17 @@ class FSM:
         Adds the connection of a state
         """
         self._check_valid_transition(src, dest, stimulus, output)
-        self._transitions[src][stimulus] = (dest, output)
+        self._invalidate()
+        t = self._state_index[src] * len(self.S) + self._stimulus_index[stimulus]
+        self._next_state[t] = self._state_index[dest]
+        self._output[t] = self._output_index[output]
+
+    def _invalidate(self) -> None:
+        self._successors = None
+        self._accessible = None
+        self._inaccessible_states = None
+        self._partitions = None
+        self._canonical = None
 
     def add_transitions(
             self,
@@ -81,132 +183,401 @@ class FSM:
             dest_state, output = t
             self.add_transition(src=state, dest=dest_state, stimulus=stimulus, output=output)
 
+    @profiler.timed("fsm.connected")
     def connected(self) -> 'FSM':
-        inaccessible_states = self._get_inaccessible_states()
-        accessible_states = list(self.Q)
-        connected_transitions = deepcopy(self._transitions)
-        for x in inaccessible_states:
-            accessible_states.remove(x)
-            del (connected_transitions[x])
-        connected_fsm = FSM(Q=tuple(accessible_states), S=self.S, R=self.R, init_state=self.init_state)
-        connected_fsm._transitions = connected_transitions
-        return connected_fsm
+        accessible = np.frombuffer(self._accessible_states, dtype=np.uint8).astype(bool)
+        accessible_states = tuple(q for q, is_accessible in zip(self.Q, accessible) if is_accessible)
+        # Position -1 of new_index stays -1 so missing transitions are kept missing
+        new_index = np.full(len(self.Q) + 1, -1, dtype=np.int32)
+        new_index[:-1][accessible] = np.arange(len(accessible_states), dtype=np.int32)
+        return FSM(
+            Q=accessible_states,
+            S=self.S,
+            R=self.R,
+            init_state=self.init_state,
+            partition_algorithm=self.partition_algorithm,
+            _next_state=_to_array(new_index[self._table(self._next_state)[accessible]]),
+            _output=_to_array(self._table(self._output)[accessible]),
+        )
 
+    @profiler.timed("fsm.minimum_equivalent")
     def minimum_equivalent(self) -> 'FSM':
+        """Quotient of the machine by its final partition, the state of block i is q{i+1}"""
         blocks = self.blocks
-        inaccessible_states = self.inaccessible_states
-        state_2_equivalent: Dict[str, str] = dict()
-        equivalent_Q = []
+        block_of = np.full(len(self.Q), -1, dtype=np.int32)
+        representatives = np.empty(len(blocks), dtype=np.int64)
         for i, block in enumerate(blocks):
-            equivalent_state = f'q{i+1}'
-            for state_2_replace in block:
-                state_2_equivalent[state_2_replace] = equivalent_state
-            equivalent_Q.append(equivalent_state)
-
-        equivalent_Q = tuple(equivalent_Q)
-        equivalent_transitions: Dict[str, Dict[str, Tuple[str, str]]] = deepcopy(self._transitions)
-        old_transitions_keys = list(equivalent_transitions.keys())
-        for old_state in old_transitions_keys:
-            if old_state in inaccessible_states:
-                continue
-            transitions_2_map = equivalent_transitions[old_state]
-            for stimulus in transitions_2_map.keys():
-                old_transition = transitions_2_map[stimulus]
-                dest_state, output = old_transition
-                transitions_2_map[stimulus] = (state_2_equivalent[dest_state], output)
-            renamed_state = state_2_equivalent[old_state]
-            equivalent_transitions[renamed_state] = transitions_2_map
-        pprint(state_2_equivalent)
-        keys = list(equivalent_transitions.keys())
-        for k in keys:
-            if not k.startswith('q'):
-                del equivalent_transitions[k]
-        equivalent_initial_state = state_2_equivalent[self.init_state]
-        minimum_equivalent_fsm = FSM(
+            for state in block:
+                block_of[self._state_index[state]] = i
+            representatives[i] = self._state_index[block[0]]
+        equivalent_Q = tuple(f'q{i+1}' for i in range(len(blocks)))
+        equivalent_initial_state = equivalent_Q[block_of[self._init_state_index]]
+        return FSM(
             Q=equivalent_Q,
             R=self.R,
             S=self.S,
-            init_state=equivalent_initial_state
+            init_state=equivalent_initial_state,
+            partition_algorithm=self.partition_algorithm,
+            _next_state=_to_array(block_of[self._table(self._next_state)[representatives]]),
+            _output=_to_array(self._table(self._output)[representatives]),
         )
-        minimum_equivalent_fsm._transitions = equivalent_transitions
-        return minimum_equivalent_fsm
+
+    def canonical_form(self) -> bytes:
+        """Bytes equal for two machines if and only if they are equivalent: same input
+        alphabet and same outputs for every input sequence from their initial states.
+
+        The minimum equivalent is renumbered in breadth first order from its initial
+        state, following the stimuli sorted by name, and the outputs it uses are
+        numbered by sorted name. The bytes hold |Q|, |S|, the number of outputs and
+        the lengths of both alphabets, the names of the sorted stimuli and of the
+        outputs, then the next state and output tables, all as little endian int32.
+        """
+        if self._canonical is None:
+            self._canonical = self._get_canonical_form()
+        return self._canonical
+
+    def canonical_hash(self) -> str:
+        """SHA-1 of `canonical_form`, to index machines by equivalence class"""
+        return hashlib.sha1(self.canonical_form()).hexdigest()
+
+    def distinguishing_sequence(self, other: 'FSM') -> Optional[List[str]]:
+        """Shortest sequence of stimuli giving different outputs from the initial
+        states of both machines, None if they are equivalent. A missing transition
+        only matches another missing transition.
+
+        Pairs of states of the product machine are visited breadth first without
+        building it, in the manner of Hopcroft and Karp: the states of a pair are
+        merged in a union-find over the states of both machines, and pairs already
+        in the same set are not visited again, so at most |Q| + |Q'| - 1 pairs are.
+        """
+        if set(self.S) != set(other.S):
+            raise ValueError(f"Machines have different input alphabets {self.S} and {other.S}")
+        k, other_k = len(self.S), len(other.S)
+        n = len(self.Q)
+        other_stimulus = [other._stimulus_index[s] for s in self.S]
+        parent = list(range(n + len(other.Q)))
+
+        def find(x: int) -> int:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        start = (self._init_state_index, other._init_state_index)
+        parent[n + start[1]] = start[0]
+        # Pairs in the order they are reached, each with the pair and stimulus it came from
+        pairs = [start]
+        previous = [-1]
+        stimulus_of = [-1]
+        for i, (p, q) in enumerate(pairs):
+            for a in range(k):
+                t, other_t = p * k + a, q * other_k + other_stimulus[a]
+                dest, other_dest = self._next_state[t], other._next_state[other_t]
+                output = self.R[self._output[t]] if dest >= 0 else None
+                other_output = other.R[other._output[other_t]] if other_dest >= 0 else None
+                if output != other_output:
+                    sequence = [self.S[a]]
+                    while previous[i] >= 0:
+                        sequence.append(self.S[stimulus_of[i]])
+                        i = previous[i]
+                    return sequence[::-1]
+                if dest < 0:
+                    continue
+                root, other_root = find(dest), find(n + other_dest)
+                if root != other_root:
+                    parent[other_root] = root
+                    pairs.append((dest, other_dest))
+                    previous.append(i)
+                    stimulus_of.append(a)
+        return None
+
+    def equivalent(self, other: 'FSM') -> bool:
+        """True if both machines give the same outputs for every sequence of stimuli"""
+        return self.distinguishing_sequence(other) is None
+
+    def _table(self, transitions: array) -> np.ndarray:
+        """|Q| x |S| NumPy view of `_next_state` or `_output`, without copying"""
+        return np.frombuffer(transitions, dtype=np.int32).reshape(len(self.Q), len(self.S))
 
     def _partition(self, verbose: bool = False) -> List[List[List[str]]]:
-        initial_partition: List[List[str]] = []
-        possible_outs: Dict[Tuple, Set[str]] = dict()
-        self._inaccessible_states = self._get_inaccessible_states()
-        for i in self._transitions.keys():
-            if i in self._inaccessible_states:
+        k = len(self.S)
+        accessible = self._accessible_states
+        initial_partition: List[List[int]] = []
+        possible_outs: Dict[bytes, List[int]] = dict()
+        for i in range(len(self.Q)):
+            if not accessible[i]:
                 continue
-            outs = tuple(map(lambda x: x[1], self._transitions[i].values()))
+            if -1 in self._next_state[i * k:i * k + k]:
+                raise KeyError(f'state {self.Q[i]} does not have a transition for every stimulus in {self.S}')
+            outs = self._output[i * k:i * k + k].tobytes()
             if outs not in possible_outs:
-                possible_outs[outs] = {i}
+                possible_outs[outs] = [i]
             else:
-                possible_outs[outs].add(i)
+                possible_outs[outs].append(i)
         for block in possible_outs.values():
-            initial_partition.append(list(block))
+            initial_partition.append(block)
         if verbose:
             print(initial_partition)
-        partitions = [list(self.Q), initial_partition]
-        return self._recursive_partition(partitions=partitions, verbose=verbose)
-
-    def _get_successors(self, partition: List[List[str]]) -> List[List[Tuple]]:
-        block_s_successors: List[List[Tuple]] = []
-        for block in partition:
-            block_successors: List[Tuple] = []
-            for state in block:
-                state_successors = tuple(self._transitions[state][s][0]
-                                         for s in self.S)
-                block_successors.append(state_successors)
-            block_s_successors.append(block_successors)
-        return block_s_successors
-
-    def _recursive_partition(self, partitions: List[List[List[str]]], verbose: bool = False) -> List[List[List[str]]]:
-        prev_partition = partitions[-1]
-        block_s_successors = self._get_successors(prev_partition)
-
-        new_partition_buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = dict()
-        for i_block in range(len(prev_partition)):
-            for i_successors in range(len(block_s_successors[i_block])):
-                s_successors = block_s_successors[i_block][i_successors]
-                # Add as prefix the block in order to differentiate
-                prev_block_belongs = (i_block, tuple(self._which_block(s, prev_partition)
-                                                     for s in s_successors)
-                                      )
-                state_belongs = prev_partition[i_block][i_successors]
-                if prev_block_belongs not in new_partition_buckets:
-                    new_partition_buckets[prev_block_belongs] = [state_belongs]
-                else:
-                    new_partition_buckets[prev_block_belongs].append(state_belongs)
-
-        new_partition: List[List[str]] = list(new_partition_buckets.values())
-        if verbose:
-            print(new_partition)
-        if new_partition == prev_partition:
-            return partitions
+        partitions = [initial_partition]
+        names = list(self.Q)
+        # Rounds of the vectorized algorithm, named straight from their NumPy order
+        named_rounds: List[List[List[str]]] = list()
+        if self.partition_algorithm == "hopcroft":
+            final_partition = self._hopcroft_partition(initial_partition)
+            if len(final_partition) != len(initial_partition):
+                partitions.append(final_partition)
+            if verbose:
+                print(final_partition)
+        elif self.partition_algorithm == "vectorized":
+            for order, bounds in self._vectorized_partition(initial_partition, verbose=verbose):
+                # One name lookup per state and round, the blocks are slices of them
+                flat = list(map(names.__getitem__, order))
+                named_rounds.append([flat[start:stop] for start, stop in zip(bounds, bounds[1:])])
         else:
+            self._recursive_partition(partitions=partitions, verbose=verbose)
+        return [names] + [
+            [list(map(names.__getitem__, block)) for block in partition] for partition in partitions
+        ] + named_rounds
+
+    def _hopcroft_partition(self, initial_partition: List[List[int]]) -> List[List[int]]:
+        """Refines the initial partition with Hopcroft's algorithm.
+
+        The blocks live in a refinable partition (Valmari & Lehtinen): the states of a
+        block are contiguous in `elems`, marking a state swaps it to the front of its
+        block and a split only relabels the smaller half, which gives O(n·k·log n).
+        Blocks are returned ordered by their first state in Q.
+        """
+        k = len(self.S)
+        next_state = self._next_state
+
+        # Predecessors of state q under the stimulus a are
+        # pred[pred_start[q * k + a]:pred_start[q * k + a + 1]]
+        pred_start = [0] * (len(self.Q) * k + 1)
+        edges: List[Tuple[int, int]] = []
+        for block in initial_partition:
+            for p in block:
+                for a in range(k):
+                    key = next_state[p * k + a] * k + a
+                    pred_start[key + 1] += 1
+                    edges.append((key, p))
+        for i in range(1, len(pred_start)):
+            pred_start[i] += pred_start[i - 1]
+        pred = [0] * len(edges)
+        fill = pred_start[:-1]
+        for key, p in edges:
+            pred[fill[key]] = p
+            fill[key] += 1
+
+        elems: List[int] = []
+        loc = [-1] * len(self.Q)
+        sidx = [-1] * len(self.Q)
+        first: List[int] = []
+        end: List[int] = []
+        for b, block in enumerate(initial_partition):
+            first.append(len(elems))
+            for q in block:
+                loc[q] = len(elems)
+                sidx[q] = b
+                elems.append(q)
+            end.append(len(elems))
+        mid = first[:]
+
+        # Splitting by every block but one is enough, the largest one is implied
+        largest = max(range(len(first)), key=lambda b: end[b] - first[b], default=0)
+        waiting = [b for b in range(len(first)) if b != largest]
+        while waiting:
+            splitter = waiting.pop()
+            profiler.count("fsm.hopcroft_splitters")
+            for a in range(k):
+                touched: List[int] = []
+                for q in elems[first[splitter]:end[splitter]]:
+                    key = q * k + a
+                    for t in range(pred_start[key], pred_start[key + 1]):
+                        p = pred[t]
+                        b = sidx[p]
+                        j, i = mid[b], loc[p]
+                        other = elems[j]
+                        elems[j], elems[i] = p, other
+                        loc[p], loc[other] = j, i
+                        if j == first[b]:
+                            touched.append(b)
+                        mid[b] = j + 1
+                for b in touched:
+                    j = mid[b]
+                    mid[b] = first[b]
+                    if j == end[b]:
+                        continue
+                    # The new block takes the smaller half, so it is the one to wait for
+                    if j - first[b] <= end[b] - j:
+                        first.append(first[b])
+                        end.append(j)
+                        first[b] = mid[b] = j
+                    else:
+                        first.append(j)
+                        end.append(end[b])
+                        end[b] = j
+                    mid.append(first[-1])
+                    new_block = len(first) - 1
+                    for i in range(first[new_block], end[new_block]):
+                        sidx[elems[i]] = new_block
+                    waiting.append(new_block)
+
+        blocks = [sorted(elems[first[b]:end[b]]) for b in range(len(first))]
+        blocks.sort()
+        return blocks
+
+    def _recursive_partition(self, partitions: List[List[List[int]]], verbose: bool = False) -> List[List[List[int]]]:
+        k = len(self.S)
+        block_of = [-1] * len(self.Q)
+        while True:
+            prev_partition = partitions[-1]
+            for i_block, block in enumerate(prev_partition):
+                for state in block:
+                    block_of[state] = i_block
+
+            new_partition_buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = dict()
+            for i_block, block in enumerate(prev_partition):
+                for state in block:
+                    # Add as prefix the block in order to differentiate
+                    prev_block_belongs = (i_block, tuple(block_of[s] for s in
+                                                         self._next_state[state * k:state * k + k]))
+                    if prev_block_belongs not in new_partition_buckets:
+                        new_partition_buckets[prev_block_belongs] = [state]
+                    else:
+                        new_partition_buckets[prev_block_belongs].append(state)
+
+            new_partition: List[List[int]] = list(new_partition_buckets.values())
+            profiler.count("fsm.partition_rounds")
+            if verbose:
+                print(new_partition)
+            if len(new_partition) == len(prev_partition):
+                return partitions
             partitions.append(new_partition)
-            return self._recursive_partition(partitions)
 
-    @staticmethod
-    def _which_block(successor: int, partition: List[List[str]]) -> int:
-        for i, block in enumerate(partition):
-            if successor in block:
-                return i
+    def _vectorized_partition(
+        self, initial_partition: List[List[int]], verbose: bool = False
+    ) -> List[Tuple[List[int], List[int]]]:
+        """Same rounds as `_recursive_partition`, each one computed with a few NumPy passes.
+
+        The signature of a state is its block id followed by the block ids of its
+        successors (a single gather `block_id[next_state]`), and the new blocks are the
+        distinct signatures. Blocks are numbered by first appearance while walking the
+        previous partition, so every round matches the moore algorithm block by block.
+        Every round after the initial partition is returned as the states in block
+        order and the bounds of the blocks in it: block i is order[bounds[i]:bounds[i + 1]].
+        """
+        k = len(self.S)
+        next_state = self._table(self._next_state)
+        order = np.fromiter((q for block in initial_partition for q in block), dtype=np.int64)
+        block_id = np.full(len(self.Q), -1, dtype=np.int64)
+        sizes = [len(block) for block in initial_partition]
+        block_id[order] = np.repeat(np.arange(len(initial_partition)), sizes)
+        n_blocks = len(initial_partition)
+        rounds: List[Tuple[List[int], List[int]]] = list()
+        signature = np.empty((len(order), k + 1), dtype=np.int64)
+        while True:
+            signature[:, 0] = block_id[order]
+            signature[:, 1:] = block_id[next_state[order]]
+            if n_blocks ** (k + 1) < 2 ** 63:
+                # The signature as a single number in base n_blocks, cheaper to sort
+                key = signature @ (n_blocks ** np.arange(k, -1, -1, dtype=np.int64))
+                _, inverse = np.unique(key, return_inverse=True)
+            else:
+                _, inverse = np.unique(signature, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            _, first_seen = np.unique(inverse, return_index=True)
+            profiler.count("fsm.partition_rounds")
+            if len(first_seen) == n_blocks:
+                return rounds
+            n_blocks = len(first_seen)
+            rank = np.empty(n_blocks, dtype=np.int64)
+            rank[np.argsort(first_seen)] = np.arange(n_blocks)
+            labels = rank[inverse]
+            block_id[order] = labels
+            by_block = np.argsort(labels, kind="stable")
+            order = order[by_block]
+            flat = order.tolist()
+            bounds = [0] + np.cumsum(np.bincount(labels, minlength=n_blocks)).tolist()
+            if verbose:
+                print([flat[start:stop] for start, stop in zip(bounds, bounds[1:])])
+            rounds.append((flat, bounds))
+
+    def _get_canonical_form(self) -> bytes:
+        minimum = self.minimum_equivalent()
+        stimuli = sorted(range(len(self.S)), key=lambda a: self.S[a])
+        next_state = minimum._table(minimum._next_state)[:, stimuli]
+        output = minimum._table(minimum._output)[:, stimuli]
+
+        # Minimum machines are connected, so the search reaches every state
+        number = np.full(len(minimum.Q), -1, dtype=np.int32)
+        order = [minimum._init_state_index]
+        number[order[0]] = 0
+        for q in order:
+            for dest in next_state[q].tolist():
+                if number[dest] < 0:
+                    number[dest] = len(order)
+                    order.append(dest)
+
+        used_outputs = sorted({self.R[r] for r in np.unique(output).tolist()})
+        output_number = np.full(len(self.R), -1, dtype=np.int32)
+        output_number[[self._output_index[r] for r in used_outputs]] = np.arange(len(used_outputs))
+        stimulus_names = "\0".join(self.S[a] for a in stimuli).encode()
+        output_names = "\0".join(used_outputs).encode()
+        header = np.array(
+            [len(order), len(stimuli), len(used_outputs), len(stimulus_names), len(output_names)],
+            dtype="<i4",
+        )
+        return b"".join(
+            [
+                header.tobytes(),
+                stimulus_names,
+                output_names,
+                number[next_state[order]].astype("<i4").tobytes(),
+                output_number[output[order]].astype("<i4").tobytes(),
+            ]
+        )
 
     def _get_inaccessible_states(self) -> List[str]:
-        accessible_states: Set[str] = set()
-        self._get_accessible_states_from(self.init_state, accessible_states)
-        inaccessible_states = list(set(self.Q) - accessible_states)
-        return inaccessible_states
-
-    def _get_accessible_states_from(self, src: str, visited: Set[str]) -> None:
-        to_visit = set(map(lambda x: x[0], self._transitions[src].values()))
-        visited.add(src)
-        for to_vis in to_visit:
-            if to_vis not in visited:
-                self._get_accessible_states_from(to_vis, visited)
+        accessible = self._accessible_states
+        return [q for i, q in enumerate(self.Q) if not accessible[i]]
+
+    def _get_accessible_states(self) -> bytearray:
+        visited = bytearray(len(self.Q))
+        self._get_accessible_states_from(self._init_state_index, visited)
+        return visited
+
+    def _get_accessible_states_from(self, src: int, visited: bytearray) -> None:
+        """Breadth-first search over the successor index, the queue is allocated once"""
+        offsets, targets = self._successor_index
+        queue = array("i", [0]) * len(self.Q)
+        queue[0] = src
+        visited[src] = 1
+        head, tail = 0, 1
+        while head < tail:
+            state = queue[head]
+            head += 1
+            for t in range(offsets[state], offsets[state + 1]):
+                dest_state = targets[t]
+                if not visited[dest_state]:
+                    visited[dest_state] = 1
+                    queue[tail] = dest_state
+                    tail += 1
 
+    def _get_successor_index(self) -> Tuple[array, array]:
+        k = len(self.S)
+        offsets = array("i", [0]) * (len(self.Q) + 1)
+        targets = array("i")
+        # last_source[d] == q when d was already listed as a successor of q
+        last_source = array("i", [-1]) * len(self.Q)
+        for q in range(len(self.Q)):
+            for dest_state in self._next_state[q * k:q * k + k]:
+                if dest_state >= 0 and last_source[dest_state] != q:
+                    last_source[dest_state] = q
+                    targets.append(dest_state)
+            offsets[q + 1] = len(targets)
+        return offsets, targets
+
+    @profiler.timed("fsm.render")
     def __repr__(self) -> str:
         string = ""
         names = ["states", "input alphabet", "output alphabet"]
@@ -229,3 +600,9 @@ class FSM:
         for i, p in enumerate(self.partitions):
             string += f"p{i}: {p}\n"
         return string
+
+
+def _to_array(table: np.ndarray) -> array:
+    transitions = array("i")
+    transitions.frombytes(np.ascontiguousarray(table, dtype=np.int32).tobytes())
+    return transitions
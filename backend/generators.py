@@ -0,0 +1,255 @@
+"""Seeded random workloads: machines, CNF grammars and strings, and the input text
+of the solvers for them. The same seed always gives the same workload."""
+from array import array
+from itertools import chain
+from typing import List, Optional, Sequence, Tuple
+import random
+import sys
+
+import numpy as np
+
+from fsm import FSM
+from cyk import Grammar, InputString, Production, Terminal, Variable
+
+
+def random_fsm(
+    n_states: int,
+    n_inputs: int = 2,
+    n_outputs: int = 2,
+    seed: int = 0,
+    partition_algorithm: str = "moore",
+) -> FSM:
+    """Builds a complete Mealy machine with uniformly random transitions"""
+    rng = random.Random(seed)
+    Q = tuple(f"s{i}" for i in range(n_states))
+    S = tuple(str(i) for i in range(n_inputs))
+    R = tuple(str(i) for i in range(n_outputs))
+    next_state = array("i", (rng.randrange(n_states) for _ in range(n_states * n_inputs)))
+    output = array("i", (rng.randrange(n_outputs) for _ in range(n_states * n_inputs)))
+    return FSM(
+        S=S,
+        R=R,
+        Q=Q,
+        init_state=Q[0],
+        partition_algorithm=partition_algorithm,
+        _next_state=next_state,
+        _output=output,
+    )
+
+
+def random_machine(
+    n_states: int,
+    n_inputs: int = 2,
+    n_outputs: int = 2,
+    n_classes: Optional[int] = None,
+    unreachable: float = 0.0,
+    moore: bool = False,
+    seed: int = 0,
+    partition_algorithm: str = "moore",
+) -> FSM:
+    """Builds a complete machine whose accessible states fall in exactly n_classes
+    blocks of the final partition.
+
+    The accessible states are split among the classes of a random machine of
+    n_classes states, where stimulus 0 moves class i to class i + 1 and only class 0
+    outputs R[1] with it, so no two classes are equivalent. Every state goes where
+    its class goes, to a random state of the destination class, so the states of a
+    class are equivalent. The unreachable states have random transitions.
+    Args:
+        n_classes (Optional[int]): blocks of the final partition, all the accessible
+            states by default so the accessible part is already minimal
+        unreachable (float): fraction of the states that are not accessible from
+            the initial state
+        moore (bool): the output only depends on the state leaving, as in the
+            machines of type "S"
+    """
+    rng = np.random.default_rng(seed)
+    k = n_inputs
+    n_reachable = n_states - round(unreachable * n_states)
+    n_classes = n_reachable if n_classes is None else n_classes
+    if n_reachable < 1:
+        raise ValueError("The initial state is accessible, unreachable must be below 1")
+    if not 1 <= n_classes <= n_reachable:
+        raise ValueError(f"n_classes must be between 1 and {n_reachable}, got {n_classes}")
+    if n_classes > 1 and n_outputs < 2:
+        raise ValueError("Telling classes apart needs at least 2 outputs")
+
+    class_next = rng.integers(n_classes, size=(n_classes, k))
+    class_next[:, 0] = (np.arange(n_classes) + 1) % n_classes
+    # Class 0 is the only one giving R[1] with stimulus 0
+    class_output = rng.integers(n_outputs, size=(n_classes, k))
+    if n_outputs > 1:
+        class_output[class_output == 1] = 0
+        class_output[0, 0] = 1
+    if moore:
+        class_output[:] = class_output[:, :1]
+
+    next_state = [-1] * (n_reachable * k)
+    class_of = list(range(n_classes))
+    # A state per class along stimulus 0, then every new state is the destination
+    # of a transition still free, so all of them are accessible
+    for c in range(1, n_classes):
+        next_state[(c - 1) * k] = c
+    free = [t for t in range(n_classes * k) if next_state[t] < 0]
+    class_next_list = class_next.tolist()
+    for pick in rng.random(n_reachable - n_classes).tolist():
+        i = int(pick * len(free))
+        free[i], free[-1] = free[-1], free[i]
+        t = free.pop()
+        r = len(class_of)
+        class_of.append(class_next_list[class_of[t // k]][t % k])
+        next_state[t] = r
+        free.extend(range(r * k, r * k + k))
+
+    # The other transitions go to a random state of the class of their destination
+    classes = np.array(class_of, dtype=np.int64)
+    by_class = np.argsort(classes, kind="stable")
+    class_sizes = np.bincount(classes, minlength=n_classes)
+    class_starts = np.cumsum(class_sizes) - class_sizes
+    free_transitions = np.array(free, dtype=np.int64)
+    destination_classes = class_next[classes[free_transitions // k], free_transitions % k]
+    offsets = (rng.random(len(free)) * class_sizes[destination_classes]).astype(np.int64)
+    next_state_table = np.empty((n_states, k), dtype=np.int64)
+    next_state_table[:n_reachable] = np.array(next_state, dtype=np.int64).reshape(n_reachable, k)
+    next_state_table.flat[free_transitions] = by_class[class_starts[destination_classes] + offsets]
+    output_table = np.empty((n_states, k), dtype=np.int64)
+    output_table[:n_reachable] = class_output[classes]
+
+    n_unreachable = n_states - n_reachable
+    next_state_table[n_reachable:] = rng.integers(n_states, size=(n_unreachable, k))
+    output_table[n_reachable:] = rng.integers(n_outputs, size=(n_unreachable, 1 if moore else k))
+
+    # Shuffle the states, keeping the initial one first
+    order = np.concatenate([[0], 1 + rng.permutation(n_states - 1)])
+    position = np.empty(n_states, dtype=np.int64)
+    position[order] = np.arange(n_states)
+    Q = tuple(f"s{i}" for i in range(n_states))
+    return FSM(
+        S=tuple(str(i) for i in range(n_inputs)),
+        R=tuple(str(i) for i in range(n_outputs)),
+        Q=Q,
+        init_state=Q[0],
+        partition_algorithm=partition_algorithm,
+        _next_state=array("i", position[next_state_table[order]].astype(np.int32).tobytes()),
+        _output=array("i", output_table[order].astype(np.int32).tobytes()),
+    )
+
+
+def fsm_input(fsms: Sequence[FSM], moore: bool = False) -> str:
+    """Input of `main.iter_test_cases` holding the machines
+    Args:
+        moore (bool): write them as machines of type "S", with the output of the
+            first stimulus of every state. Only right for Moore machines
+    """
+    lines = [str(len(fsms))]
+    for fsm in fsms:
+        k = len(fsm.S)
+        Q, R = fsm.Q, fsm.R
+        init = fsm._init_state_index
+        # The initial state is the first one of the input
+        order = [init] + [q for q in range(len(Q)) if q != init]
+        lines += ["S" if moore else "T", " ".join(fsm.S), " ".join(R)]
+        lines.append(" ".join(Q[q] for q in order))
+        next_state, output = fsm._next_state, fsm._output
+        for q in order:
+            row = range(q * k, q * k + k)
+            if moore:
+                cells = [Q[next_state[t]] for t in row] + [R[output[q * k]]]
+            else:
+                cells = list(chain.from_iterable((Q[next_state[t]], R[output[t]]) for t in row))
+            lines.append(" ".join([Q[q], *cells]))
+    return "\n".join(lines)
+
+
+def _symbol_names(count: int, upper: bool, first: str) -> List[str]:
+    """count one character names, first then the other ASCII letters and then the
+    ones from unicode, of the given case"""
+    names = [first]
+    ascii_letters = range(ord("A"), ord("Z") + 1) if upper else range(ord("a"), ord("z") + 1)
+    for code in chain(ascii_letters, range(0x80, sys.maxunicode + 1)):
+        if len(names) == count:
+            break
+        name = chr(code)
+        # ε stands for the empty string in the input
+        if (name.isupper() if upper else name.islower()) and name not in (first, "ε"):
+            names.append(name)
+    if len(names) < count:
+        raise ValueError(f"There are not {count} one character names")
+    return names[:count]
+
+
+def random_cnf_grammar(
+    n_variables: int,
+    n_terminals: int = 2,
+    binary_rules: int = 2,
+    terminal_rules: int = 1,
+    seed: int = 0,
+) -> Grammar:
+    """Builds a grammar in Chomsky normal form with start variable S, where every
+    variable has binary_rules rules A -> BC and terminal_rules rules A -> a picked
+    at random, so every variable produces strings of every length"""
+    rng = random.Random(seed)
+    variables = list(map(Variable, _symbol_names(n_variables, upper=True, first="S")))
+    terminals = list(map(Terminal, _symbol_names(n_terminals, upper=False, first="a")))
+    binary = [(B, C) for B in variables for C in variables]
+    productions = {
+        A: set(
+            rng.sample(binary, min(binary_rules, len(binary)))
+            + [(a,) for a in rng.sample(terminals, min(terminal_rules, len(terminals)))]
+        )
+        for A in variables
+    }
+    return Grammar(
+        start=variables[0],
+        variables=set(variables),
+        terminals=set(terminals),
+        productions=productions,
+    )
+
+
+def random_string(length: int, terminals: List[str], seed: int = 0) -> InputString:
+    rng = random.Random(seed)
+    return [(Terminal(rng.choice(terminals)),) for _ in range(length)]
+
+
+def random_derivation(G: Grammar, length: int, seed: int = 0) -> InputString:
+    """String of the given length produced by the CNF grammar G, derived with rules
+    and split points picked at random"""
+    rng = random.Random(seed)
+    string: InputString = list()
+    pending: List[Tuple[Variable, int]] = [(G.start, length)]
+    while pending:
+        variable, n = pending.pop()
+        rules = sorted(
+            (p for p in G.productions.get(variable, ()) if len(p) == min(n, 2)), key=str
+        )
+        if not rules:
+            raise ValueError(f"{variable} has no rule for a substring of length {n}")
+        rule: Production = rng.choice(rules)
+        if n == 1:
+            string.append((rule[0],))
+            continue
+        split = rng.randint(1, n - 1)
+        pending += [(rule[1], n - split), (rule[0], split)]
+    return string
+
+
+def cyk_input(cases: Sequence[Tuple[Grammar, InputString]]) -> str:
+    """Input of `cyk.parse_input` holding the grammars and strings. Every variable
+    needs a rule, since the input has a line of rules per variable"""
+    lines = [str(len(cases))]
+    for G, string in cases:
+        variables = sorted(G.variables, key=lambda v: (v != G.start, str(v)))
+        lines += [
+            "".join(str(s[0]) for s in string),
+            str(G.start),
+            " ".join(map(str, variables)),
+            " ".join(sorted(map(str, G.terminals))),
+        ]
+        for variable in variables:
+            productions = G.productions.get(variable)
+            if not productions:
+                raise ValueError(f"{variable} has no rule")
+            alternatives = sorted("".join(map(str, p)) or "ε" for p in productions)
+            lines.append(f"{variable} -> {' | '.join(alternatives)}")
+    return "\n".join(lines)
@@ -1,42 +1,64 @@
 from fsm import FSM
-from typing import List, Callable, Dict, Tuple
-from pprint import pprint
+from batch import ordered_map
+from profiling import profiler
+from typing import Any, Dict, List, Optional, Tuple, Iterable, Iterator
+from argparse import ArgumentParser
+from itertools import islice
+import sys
 
 
 def parse_transition_table(
-    fsm: FSM, transition_table: List[str], machine_type: str
+    fsm: FSM, transition_table: Iterable[str], machine_type: str
 ) -> None:
-    S = fsm.S
-    conditions: Dict[str, Callable[[int], bool]] = {
-        "T": lambda idx: idx < 2 * len(S) + 1,
-        "S": lambda idx: idx < len(S) + 1,
-    }
-
-    get_transitions: Dict[str, Callable[[List[str], int], Tuple[str, str]]] = {
-        "T": lambda tt_row, idx: (tt_row[idx], tt_row[idx + 1]),
-        "S": lambda tt_row, idx: (tt_row[idx], tt_row[-1]),
-    }
-
-    step_rule: Dict[str, Callable[[int], int]] = {
-        "T": lambda idx: idx + len(S),
-        "S": lambda idx: idx + 1,
-    }
-
-    condition = conditions[machine_type]
-    get_transition = get_transitions[machine_type]
-    step = step_rule[machine_type]
-
+    """Adds the transitions of every row of the table to the machine
+    Args:
+        transition_table(Iterable[str]): one row per state, "q q'1 r'1 ... q'|S| r'|S|"
+            for Mealy machines ("T") or "q q'1 ... q'|S| r" for Moore machines ("S")
+        machine_type(str): "T" or "S"
+    """
+    k = len(fsm.S)
     for row in transition_table:
         row_split: List[str] = row.split()
         state = row_split[0]
-        i = 1
-        while condition(i):
-            transitions = []
-            for _ in range(len(S)):
-                transition = get_transition(row_split, i)
-                transitions.append(transition)
-                i = step(i)
-            fsm.add_transitions(state, transitions)
+        if machine_type == "T":
+            transitions = list(zip(row_split[1 : 2 * k : 2], row_split[2 : 2 * k + 1 : 2]))
+        elif machine_type == "S":
+            transitions = [(dest, row_split[-1]) for dest in row_split[1 : k + 1]]
+        else:
+            raise ValueError(f"machine type must be T or S, got {machine_type}")
+        fsm.add_transitions(state, transitions)
+
+
+@profiler.timed("fsm.parse")
+def read_test_case(lines: Iterator[str]) -> FSM:
+    """Consumes the 4 + |Q| lines of a single test case from the iterator"""
+    machine_type: str = next(lines)
+    S = next(lines).split()
+    R = next(lines).split()
+    Q = next(lines).split()
+    init_state = Q[0]
+
+    S, Q, R = map(tuple, [S, Q, R])
+    fsm = FSM(S=S, R=R, Q=Q, init_state=init_state)
+    parse_transition_table(fsm, islice(lines, len(Q)), machine_type)
+    return fsm
+
+
+def iter_test_cases(lines: Iterable[str]) -> Iterator[FSM]:
+    """Parses the test cases lazily, one machine at a time
+    Args:
+        lines(Iterable[str]): a file object or any iterable of lines, the first one
+            being the number of test cases. Blank lines are skipped
+    """
+    non_blank_lines = filter(None, map(str.strip, lines))
+    num_tests = int(next(non_blank_lines, ""))
+    for i in range(num_tests):
+        try:
+            fsm = read_test_case(non_blank_lines)
+        except StopIteration:
+            # Left in the generator it would become a RuntimeError
+            raise ValueError(f"the input ends in test case {i + 1} of {num_tests}") from None
+        yield fsm
 
 
 def solve_test_case(input_test_case: List[str]) -> Tuple[FSM, int]:
@@ -44,44 +66,89 @@ def solve_test_case(input_test_case: List[str]) -> Tuple[FSM, int]:
     Args:
         input_test_case(List[str]): List of strings containing remaining cases
     Return:
-        inaccessible_states(List[str]): inaccessible states of the FSM
-        partitioned_states(List[List[str]]): blocks conforming the final partition of the FSM
-        next_test_case_index(int): the number of lines that this test case took: 5 + |Q| + 1
+        fsm(FSM): the machine of the test case
+        next_test_case_index(int): the number of lines that this test case took: 4 + |Q|
     """
-    machine_type: str = input_test_case[0]
-    S = input_test_case[1].split()
-    R = input_test_case[2].split()
-    Q = input_test_case[3].split()
-    init_state = Q[0]
-
-    S, Q, R = map(tuple, [S, Q, R])
-    fsm = FSM(S=S, R=R, Q=Q, init_state=init_state)
-    end_test_case = 4 + len(Q)
-    transition_table = input_test_case[4:end_test_case]
-    parse_transition_table(fsm, transition_table, machine_type)
-    next_test_case_index = end_test_case
+    fsm = read_test_case(iter(input_test_case))
+    next_test_case_index = 4 + len(fsm.Q)
     return fsm, next_test_case_index
 
 
-def solve(lines: List[str]) -> List[Tuple[FSM, FSM]]:
+def minimize(fsm: FSM) -> Tuple[FSM, FSM]:
+    """Computes the partitions of the machine and its minimum equivalent, once"""
+    minimum_equivalent = fsm.minimum_equivalent()
+    minimum_equivalent.compute_partitions()
+    return fsm, minimum_equivalent
+
+
+def iter_solutions(
+    lines: Iterable[str], workers: Optional[int] = 1, chunk_size: int = 16
+) -> Iterator[Tuple[FSM, FSM]]:
+    """Yields every machine with its minimum equivalent, in input order
+    Args:
+        lines(Iterable[str]): the input, see `iter_test_cases`
+        workers(Optional[int]): processes solving test cases in parallel, None or 0
+            for one per core
+        chunk_size(int): test cases sent to a worker at once
+    """
+    return ordered_map(minimize, iter_test_cases(lines), workers, chunk_size)
+
+
+def print_solution(fsm: FSM, minimum_equivalent: FSM) -> None:
+    print(f"FSM: \n{fsm = }")
+    print()
+    print(f"Minimum equivalent: \n{minimum_equivalent}")
+    print()
+
+
+def solve(
+    lines: Iterable[str], workers: Optional[int] = 1, chunk_size: int = 16
+) -> List[Tuple[FSM, FSM]]:
+    """Prints the solution of every test case and returns all of them, so they are
+    all kept in memory. `main` prints them without keeping them"""
     solutions = []
-    num_tests = int(lines[0])
-    test_cases_index = 1
-    for t in range(num_tests):
-        test_case_input = lines[test_cases_index:]
-        fsm, next_test_case_index = solve_test_case(test_case_input)
-        print(f"FSM: \n{fsm = }")
-        print()
-        print(f"Minimum equivalent: \n{fsm.minimum_equivalent()}")
-        solutions.append((fsm, fsm.minimum_equivalent()))
-        test_cases_index += next_test_case_index
-        print()
+    for fsm, minimum_equivalent in iter_solutions(lines, workers, chunk_size):
+        print_solution(fsm, minimum_equivalent)
+        solutions.append((fsm, minimum_equivalent))
     return solutions
 
 
+def main(args: Dict[str, Any]) -> None:
+    """Prints the solution of every test case of the input file as soon as it is
+    solved, holding only the cases being solved in memory"""
+    with open(args["input_file"], "r") as f:
+        for fsm, minimum_equivalent in iter_solutions(f, args["workers"], args["chunk_size"]):
+            print_solution(fsm, minimum_equivalent)
+
+
 if __name__ == "__main__":
-    with open("../test_input.txt", "r") as f:
-        l = list(map(lambda s: s.strip(), f.readlines()))
-    print(l)
-    solve(l)
-# solve("../test_input.txt")
+    parser = ArgumentParser()
+    parser.add_argument(
+        "-i", "--input-file", help="input file name", type=str, default="../test_input.txt",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="processes solving test cases in parallel, 0 for one per core",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--chunk-size", help="test cases sent to a worker at once", type=int, default=16,
+    )
+    parser.add_argument(
+        "--profile",
+        help="print the time of every phase and the work done to stderr, with --workers 1",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        help="with --profile, also trace the peak memory of every phase",
+        action="store_true",
+    )
+    args = parser.parse_args()
+    if args.profile:
+        profiler.enable(memory=args.profile_memory)
+    main(vars(args))
+    if args.profile:
+        print(profiler.report(), file=sys.stderr)
@@ -0,0 +1,156 @@
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from threading import Lock, local
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, TypeVar
+import time
+import tracemalloc
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Returned by `Profiler.phase` while disabled, so a disabled phase costs a call
+_NO_PHASE: ContextManager[None] = nullcontext()
+
+
+class Profiler:
+    """Wall time of the phases of the solvers and counters of the work they do,
+    recorded only while enabled.
+
+    Phases are named blocks of code, `with profiler.phase("fsm.partition"):`, or
+    functions decorated with `@profiler.timed(name)`, whose calls, total and
+    longest time are added up. Nested phases are recorded on
+    their own and also count in the phase around them. Counters are named totals,
+    `profiler.count("cyk.cells", n)`, like the rounds of a partition or the cells of
+    a CYK table. With memory, the peak of the memory traced by tracemalloc during
+    every phase is recorded as well, above the memory in use when the phase
+    started, which slows everything down. A nested phase also counts in the peak
+    of the phase around it.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.memory = False
+        # name -> [calls, seconds, longest call in seconds, highest peak in bytes]
+        self._phases: Dict[str, List[float]] = dict()
+        self._counters: Dict[str, int] = dict()
+        self._lock = Lock()
+        # Per thread stack of [traced bytes at the start, peak so far] of the
+        # phases open, outermost first
+        self._memory_frames = local()
+
+    def enable(self, memory: bool = False) -> None:
+        self.enabled = True
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self) -> None:
+        self.enabled = False
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.memory = False
+
+    def phase(self, name: str) -> ContextManager[None]:
+        if not self.enabled:
+            return _NO_PHASE
+        return self._timed_phase(name)
+
+    @contextmanager
+    def _timed_phase(self, name: str) -> Iterator[None]:
+        memory = self.memory and tracemalloc.is_tracing()
+        peak = 0
+        if memory:
+            frames = self._memory_frames.__dict__.setdefault("stack", [])
+            current, outer_peak = tracemalloc.get_traced_memory()
+            if frames:
+                # reset_peak drops the peak of the phase around this one so far
+                frames[-1][1] = max(frames[-1][1], outer_peak)
+            tracemalloc.reset_peak()
+            frames.append([current, current])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if memory:
+                frame = frames.pop()
+                frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+                peak = frame[1] - frame[0]
+                if frames:
+                    frames[-1][1] = max(frames[-1][1], frame[1])
+            with self._lock:
+                phase = self._phases.setdefault(name, [0, 0.0, 0.0, 0])
+                phase[0] += 1
+                phase[1] += elapsed
+                phase[2] = max(phase[2], elapsed)
+                phase[3] = max(phase[3], peak)
+
+    def timed(self, name: str) -> Callable[[F], F]:
+        """Decorator recording every call of the function as the phase name"""
+
+        def decorator(fn: F) -> F:
+            @wraps(fn)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self._timed_phase(name):
+                    return fn(*args, **kwargs)
+
+            return wrapper  # type: ignore
+
+        return decorator
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def reset(self) -> None:
+        with self._lock:
+            self._phases.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Phases and counters recorded so far, as JSON serializable dicts"""
+        with self._lock:
+            phases = {
+                name: {
+                    "calls": int(calls),
+                    "seconds": seconds,
+                    "max_seconds": longest,
+                    "peak_bytes": int(peak),
+                }
+                for name, (calls, seconds, longest, peak) in self._phases.items()
+            }
+            return {"phases": phases, "counters": dict(self._counters)}
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        """Adds the phases and counters of a snapshot, taken in another process"""
+        with self._lock:
+            for name, measures in snapshot["phases"].items():
+                phase = self._phases.setdefault(name, [0, 0.0, 0.0, 0])
+                phase[0] += measures["calls"]
+                phase[1] += measures["seconds"]
+                phase[2] = max(phase[2], measures["max_seconds"])
+                phase[3] = max(phase[3], measures["peak_bytes"])
+            for name, n in snapshot["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def report(self) -> str:
+        """Phases from the slowest one, then the counters, as a text table"""
+        snapshot = self.snapshot()
+        lines = [f"{'phase':<28}{'calls':>10}{'seconds':>12}{'max':>12}{'peak':>14}"]
+        phases = sorted(snapshot["phases"].items(), key=lambda item: -item[1]["seconds"])
+        for name, phase in phases:
+            peak = f"{phase['peak_bytes'] / 2**20:.1f} MiB" if self.memory else "-"
+            lines.append(
+                f"{name:<28}{phase['calls']:>10}{phase['seconds']:>12.4f}"
+                f"{phase['max_seconds']:>12.4f}{peak:>14}"
+            )
+        for name, n in sorted(snapshot["counters"].items()):
+            lines.append(f"{name:<28}{n:>10}")
+        return "\n".join(lines)
+
+
+# Profiler of the solvers, see `Profiler`. Disabled unless a --profile flag or the
+# PROFILE variable of the server enable it
+profiler = Profiler()
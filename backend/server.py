@@ -1,67 +1,154 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from flask import Flask, jsonify, Response, request, render_template
 from flask_cors import CORS
-from typing import Dict, List
-from main import solve as solve_fsm
-from cyk import solve as solve_cyk, del_extra_spaces, parse_input
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+import multiprocessing
+import os
+
+from cyk import ParsingError
+from cache import ResultCache, canonical_cyk_input, canonical_fsm_input
+from profiling import profiler
+from workers import SolveTimeout, run_with_time_limit, solve_cyk_request, solve_fsm_request
 
 
 app = Flask(__name__, template_folder="../dist", static_folder="../dist/static")
+# Bigger requests are rejected with 413 before being read
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_CONTENT_LENGTH", 1024 * 1024))
+# Seconds a request may take, queued or solving, before answering 504
+SOLVE_TIMEOUT = float(os.environ.get("SOLVE_TIMEOUT", 10))
+SOLVER_WORKERS = int(os.environ.get("SOLVER_WORKERS", 0)) or os.cpu_count() or 1
+# Workers forked from the server could inherit the locks held by the threads of a
+# discarded pool and hang, so they are started by a fork server where there is one
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+# "1" records the phases of every request for /api/v1.0/metrics, "memory" also
+# traces their allocations
+PROFILE = os.environ.get("PROFILE", "")
+if PROFILE:
+    profiler.enable(memory=PROFILE == "memory")
+
+# Part of every result cache key. Bump it when a change to the solvers or to the
+# JSON of the answers makes the results cached before it stale
+RESULT_FORMAT = "1"
+# Solutions of the inputs already solved, also written to RESULT_CACHE_PATH if set
+result_cache = ResultCache(
+    max_bytes=int(os.environ.get("RESULT_CACHE_BYTES", 64 * 1024 * 1024)),
+    ttl=float(os.environ.get("RESULT_CACHE_TTL", 3600)) or None,
+    path=os.environ.get("RESULT_CACHE_PATH"),
+)
 
 
 cors = CORS(app, resources={r"/api/*": {"origins": "*"}},)
 
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = Lock()
+
+# Errors of the solvers caused by the input, answered with 400. Any other one is a
+# failure of the server, answered with 500
+INPUT_ERRORS = (ValueError, KeyError, IndexError, ParsingError)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Pool solving the requests, so request threads only wait on it and a big
+    input does not hold the GIL of the server"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=SOLVER_WORKERS, mp_context=multiprocessing.get_context(START_METHOD)
+            )
+        return _executor
+
+
+def discard_executor(executor: ProcessPoolExecutor) -> None:
+    """Drops a pool broken by the death of a worker, so the next request starts a
+    new one. A pool already replaced by another request is left as it is"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+@profiler.timed("server.request")
+def offload(
+    solver: Callable[[str, bool], Dict[str, Any]], canonical_input: Callable[[str], str]
+) -> Union[Response, Tuple[Response, int]]:
+    """Runs the solver on the posted input in the worker pool, unless its solution
+    is in `result_cache`. The X-Cache header of the response tells which one.
+    The body is {"input": str, "verbose": bool}, verbose adding the text report
+    """
+    body: Dict[str, Any] = request.get_json(silent=True) or dict()
+    if not isinstance(body.get("input"), str):
+        return jsonify({"error": "input must be a string"}), 400
+    verbose = body.get("verbose", False)
+    if not isinstance(verbose, bool):
+        return jsonify({"error": "verbose must be a boolean"}), 400
+    key = ResultCache.key(RESULT_FORMAT, request.path, str(verbose), canonical_input(body["input"]))
+    cached = result_cache.get(key)
+    if cached is not None:
+        return Response(cached, mimetype="application/json", headers={"X-Cache": "HIT"})
+
+    executor = get_executor()
+    future = None
+    try:
+        future = executor.submit(
+            run_with_time_limit, solver, body["input"], verbose, SOLVE_TIMEOUT, PROFILE
+        )
+        result, snapshot = future.result(timeout=SOLVE_TIMEOUT)
+        if snapshot is not None:
+            profiler.merge(snapshot)
+        with profiler.phase("server.serialize"):
+            solution = app.json.dumps(result).encode()
+        result_cache.put(key, solution)
+        return Response(solution, mimetype="application/json", headers={"X-Cache": "MISS"})
+    except (TimeoutError, SolveTimeout):
+        # Still queued, it is dropped. Already running, the worker interrupts it
+        if future is not None:
+            future.cancel()
+        return jsonify({"error": f"no solution after {SOLVE_TIMEOUT} seconds"}), 504
+    except BrokenProcessPool:
+        # A worker died (killed, out of memory...), the pool fails every request after
+        app.logger.exception("Solver worker died, starting a new pool")
+        discard_executor(executor)
+        return jsonify({"error": "the solver failed, try again"}), 503
+    except INPUT_ERRORS as e:
+        app.logger.info(f"Invalid input: {e!r}")
+        return jsonify({"error": str(e)}), 400
+    except Exception:
+        app.logger.exception("Solver failed")
+        return jsonify({"error": "internal error"}), 500
+
 
 @app.route("/api/v1.0/solve", methods=["POST"])
-def solution() -> Response:
-    if request.method == "POST":
-        response: Dict[str, str] = request.get_json()
-        inp: List[str] = response["input"].split("\n")
-        inp = list(map(lambda s: s.strip(), inp))
-        solutions = solve_fsm(inp)
-        solutions_str = ""
-        for i, (input_fsm, minimum_connected_fsm) in enumerate(solutions):
-            solutions_str += f"TEST CASE {i+1}\n"
-            solutions_str += "INPUT AUTOMATA: \n"
-            solutions_str += str(input_fsm) + "\n\n"
-            solutions_str += "MINIMUM CONNECTED \n"
-            solutions_str += str(minimum_connected_fsm) + "\n"
-            solutions_str += "#" * 100 + "\n"
-        print(f"{inp}")
-        return jsonify(solutions_str)
+def solution() -> Union[Response, Tuple[Response, int]]:
+    return offload(solve_fsm_request, canonical_fsm_input)
 
 
 @app.route("/api/v1.0/cyk/solve", methods=["POST"])
-def cyk_solve() -> Response:
-    try:
-        if request.method == "POST":
-            response: Dict[str, str] = request.get_json()
-            lines: List[str] = response["input"].split("\n")
-            n = int(lines[0])
-            lines = list(map(del_extra_spaces, lines[1:]))
-            solutions_str = ""
-            for i, (G, string) in enumerate(parse_input(lines, n)):
-                ans = solve_cyk(G, string)
-                solutions_str += f"TEST CASE {i}\n"
-                solutions_str += f"Answer: {ans.result}\n"
-                solutions_str += f"Input string: \n{ans.string}\n"
-                solutions_str += "Table: \n"
-                for r in ans.table:
-                    solutions_str += str(r) + "\n"
-                solutions_str += "Detailed explanation\n"
-                solutions_str += ans.explanation
-                solutions_str += "#" * 100 + "\n"
-            return jsonify(solutions_str)
-    except Exception as e:
-        print(e)
-        return jsonify({"error": str(e)})
+def cyk_solve() -> Union[Response, Tuple[Response, int]]:
+    return offload(solve_cyk_request, canonical_cyk_input)
+
+
+@app.route("/api/v1.0/metrics", methods=["GET"])
+def metrics() -> Response:
+    """Phases and counters of the requests solved so far, merged across the workers,
+    and the statistics of the caches"""
+    return jsonify(
+        {
+            "profile": PROFILE or None,
+            "solver": profiler.snapshot(),
+            "result_cache": result_cache.stats(),
+        }
+    )
 
 
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
 def render_vue(path: str) -> str:
-    print(f"{path = }")
     return render_template("index.html")
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
@@ -0,0 +1,105 @@
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+from fsm import FSM
+
+
+class Simulator:
+    """Runs a machine on sequences of stimuli, giving the sequences of outputs.
+
+    It reads the int32 transition tables of the machine directly, so running the
+    minimum equivalent gives the same outputs with a smaller table. Missing
+    transitions raise KeyError, as everywhere else.
+
+    Arguments:
+        fsm (FSM): the machine. Changes made to it later are seen by the simulator.
+    """
+
+    def __init__(self, fsm: FSM):
+        self.fsm = fsm
+
+    def stream(self, stimuli: Iterable[str], state: Optional[str] = None) -> Iterator[str]:
+        """Yields the output of every stimulus as soon as it is read
+        Args:
+            state (Optional[str]): state to start from, the initial one by default
+        """
+        fsm = self.fsm
+        k = len(fsm.S)
+        next_state, output = fsm._next_state, fsm._output
+        stimulus_index, R = fsm._stimulus_index, fsm.R
+        q = fsm._init_state_index if state is None else fsm._state_index[state]
+        for stimulus in stimuli:
+            t = q * k + stimulus_index[stimulus]
+            if next_state[t] < 0:
+                raise KeyError(f"No transition from {fsm.Q[q]} with stimulus {stimulus}")
+            q = next_state[t]
+            yield R[output[t]]
+
+    def run(self, stimuli: Iterable[str], state: Optional[str] = None) -> List[str]:
+        return list(self.stream(stimuli, state))
+
+    def run_batch(self, sequences: Sequence[Sequence[str]]) -> List[List[str]]:
+        """Runs independent sequences from the initial state, all at once with `run_indices`.
+        The names of the stimuli and outputs are converted one by one in Python, which
+        takes most of the time on big batches: `run_indices` skips it."""
+        lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+        # Longest first, so the sequences still running are always the first rows
+        order = np.argsort(-lengths, kind="stable").tolist()
+        stimuli = np.zeros((len(sequences), int(lengths.max(initial=0))), dtype=np.int32)
+        stimulus_index = self.fsm._stimulus_index
+        for row, i in enumerate(order):
+            stimuli[row, : lengths[i]] = [stimulus_index[s] for s in sequences[i]]
+        outputs, _ = self.run_indices(stimuli, lengths[order])
+        R = self.fsm.R
+        answers: List[List[str]] = [list() for _ in sequences]
+        for row, i in enumerate(order):
+            answers[i] = [R[r] for r in outputs[row, : lengths[i]].tolist()]
+        return answers
+
+    def run_indices(
+        self,
+        stimuli: np.ndarray,
+        lengths: Optional[np.ndarray] = None,
+        states: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Runs m sequences together, each step being a single gather on the tables
+        Args:
+            stimuli (np.ndarray): m x L indices in S, one sequence per row
+            lengths (Optional[np.ndarray]): length of every row, in decreasing
+                order, when they are not all L long
+            states (Optional[np.ndarray]): index in Q of the state each sequence
+                starts from, the initial state by default
+        Return:
+            outputs (np.ndarray): m x L indices in R, -1 past the end of a row
+            states (np.ndarray): index in Q of the state each sequence ends in
+        """
+        fsm = self.fsm
+        k = len(fsm.S)
+        next_state = np.frombuffer(fsm._next_state, dtype=np.int32)
+        output = np.frombuffer(fsm._output, dtype=np.int32)
+        by_step = np.ascontiguousarray(np.asarray(stimuli, dtype=np.int64).T)
+        n_steps, m = by_step.shape
+        if states is None:
+            states = np.full(m, fsm._init_state_index, dtype=np.int64)
+        else:
+            states = np.array(states, dtype=np.int64)
+        running = (
+            np.full(n_steps, m)
+            if lengths is None
+            else np.searchsorted(-np.asarray(lengths), -np.arange(n_steps), side="left")
+        )
+
+        outputs = np.full((n_steps, m), -1, dtype=np.int32)
+        for step in range(n_steps):
+            count = running[step]
+            transitions = states[:count] * k + by_step[step, :count]
+            destinations = next_state[transitions]
+            if (destinations < 0).any():
+                sequence = int(np.flatnonzero(destinations < 0)[0])
+                raise KeyError(
+                    f"No transition from {fsm.Q[states[sequence]]} with stimulus "
+                    f"{fsm.S[by_step[step, sequence]]} in sequence {sequence}"
+                )
+            outputs[step, :count] = output[transitions]
+            states[:count] = destinations
+        return outputs.T, states
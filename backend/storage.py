@@ -0,0 +1,177 @@
+"""Binary format of a machine, all integers little endian:
+
+    header      magic b"FSMB", then as uint32: version, |Q|, |S|, |R|, index of the
+                initial state, index of the partition algorithm and a reserved 0
+    next_state  |Q| x |S| int32, row major, -1 for a missing transition, padded with
+                zeros to a multiple of 8 bytes
+    output      |Q| x |S| int32, index in R, padded the same way
+    S, R, Q     name tables: |names| + 1 int64 offsets then the UTF-8 names one
+                after the other, padded with zeros to a multiple of 8 bytes
+
+Every section starts at a multiple of 8 bytes, so the tables of a mapped file are
+used in place.
+"""
+from array import array
+from typing import Iterator, List, Sequence, Tuple, Union, overload
+import mmap
+import struct
+import sys
+
+import numpy as np
+
+from fsm import FSM, PARTITION_ALGORITHMS
+
+MAGIC = b"FSMB"
+VERSION = 1
+_HEADER = struct.Struct("<4sIIIIIII")
+
+
+class NameTable(Sequence[str]):
+    """Names of a name table, decoded when accessed"""
+
+    def __init__(self, offsets: Sequence[int], names: memoryview):
+        self._offsets = offsets
+        self._names = names
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @overload
+    def __getitem__(self, i: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, i: slice) -> Tuple[str, ...]:
+        ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[str, Tuple[str, ...]]:
+        if isinstance(i, slice):
+            return tuple(self[j] for j in range(*i.indices(len(self))))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("name index out of range")
+        return bytes(self._names[self._offsets[i] : self._offsets[i + 1]]).decode()
+
+    def __iter__(self) -> Iterator[str]:
+        names = bytes(self._names)
+        offsets = self._offsets
+        for i in range(len(self)):
+            yield names[offsets[i] : offsets[i + 1]].decode()
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return repr(tuple(self))
+
+    def __reduce__(self) -> Tuple[type, Tuple[Tuple[str, ...]]]:
+        return (tuple, (tuple(self),))
+
+
+def _name_table(names: Sequence[str]) -> bytes:
+    encoded = [name.encode() for name in names]
+    offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+    np.cumsum([len(name) for name in encoded], out=offsets[1:])
+    blob = b"".join(encoded)
+    return offsets.tobytes() + blob + bytes(-len(blob) % 8)
+
+
+def fsm_to_bytes(fsm: FSM) -> bytes:
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        len(fsm.Q),
+        len(fsm.S),
+        len(fsm.R),
+        fsm._init_state_index,
+        PARTITION_ALGORITHMS.index(fsm.partition_algorithm),
+        0,
+    )
+    padding = bytes(-4 * len(fsm.Q) * len(fsm.S) % 8)
+    tables = [
+        np.frombuffer(transitions, dtype=np.int32).astype("<i4").tobytes() + padding
+        for transitions in (fsm._next_state, fsm._output)
+    ]
+    return b"".join([header, *tables, _name_table(fsm.S), _name_table(fsm.R), _name_table(fsm.Q)])
+
+
+def _ints(buffer: memoryview, typecode: str, copy: bool) -> Union[memoryview, array]:
+    if sys.byteorder == "little" and not copy:
+        return buffer.cast(typecode)
+    values = array(typecode, buffer.tobytes())
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def fsm_from_buffer(
+    buffer: Union[bytes, bytearray, memoryview, mmap.mmap], copy: bool = False
+) -> FSM:
+    """Machine stored in the buffer, in O(|S| + |R|) time.
+
+    Without copy, the transition tables and the names of the states are read from
+    the buffer when used, so the buffer must stay unchanged while the machine is in
+    use, and a read only buffer gives a machine that cannot be changed. On big
+    endian hosts the tables are always copied.
+    """
+    view = memoryview(buffer).cast("B")
+    if len(view) < _HEADER.size:
+        raise ValueError("Buffer too short to hold a machine")
+    header = _HEADER.unpack_from(view)
+    magic, version, n_states, n_stimuli, n_outputs, init_state, algorithm, _ = header
+    if magic != MAGIC:
+        raise ValueError(f"Not a machine file, magic {magic!r} instead of {MAGIC!r}")
+    if version > VERSION:
+        raise ValueError(f"Machine file version {version} is newer than {VERSION}")
+    if init_state >= n_states or algorithm >= len(PARTITION_ALGORITHMS):
+        raise ValueError("corrupt FSM file")
+
+    position = _HEADER.size
+
+    def section(size: int) -> memoryview:
+        nonlocal position
+        if position + size > len(view):
+            raise ValueError(f"Truncated machine file of {len(view)} bytes")
+        data = view[position : position + size]
+        position += size + -size % 8
+        return data
+
+    tables = [_ints(section(4 * n_states * n_stimuli), "i", copy) for _ in range(2)]
+    names: List[NameTable] = list()
+    for count in (n_stimuli, n_outputs, n_states):
+        offsets = _ints(section(8 * (count + 1)), "q", copy)
+        names.append(NameTable(offsets, section(offsets[-1])))
+
+    S, R, Q = names
+    return FSM(
+        S=tuple(S),
+        R=tuple(R),
+        Q=tuple(Q) if copy else Q,
+        init_state=Q[init_state],
+        partition_algorithm=PARTITION_ALGORITHMS[algorithm],
+        _next_state=tables[0],
+        _output=tables[1],
+        _init_index=init_state,
+    )
+
+
+def save_fsm(fsm: FSM, path: str) -> None:
+    with open(path, "wb") as f:
+        f.write(fsm_to_bytes(fsm))
+
+
+def load_fsm(path: str, use_mmap: bool = True) -> FSM:
+    """Loads a machine saved with `save_fsm`
+    Args:
+        use_mmap (bool): map the file instead of reading it, so opening it takes the
+            same time whatever its size and only the pages used are read. Changes
+            to the machine stay in memory, the file is never written
+    """
+    with open(path, "rb") as f:
+        if not use_mmap:
+            return fsm_from_buffer(f.read(), copy=True)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    return fsm_from_buffer(mapped)
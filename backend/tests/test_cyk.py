@@ -0,0 +1,134 @@
+from typing import Iterator, List, Tuple
+
+import pytest
+
+from cyk import (
+    ENGINES,
+    Grammar,
+    IncrementalCYK,
+    InputString,
+    Terminal,
+    del_extra_spaces,
+    grammar_cache,
+    parse_input,
+    recognize,
+    solve,
+    solve_many,
+)
+
+# S -> aA is not in Chomsky normal form, the grammar produces "ab" only
+NON_CNF_INPUT = "1\nab\nS\nS A\na b\nS -> aA\nA -> b"
+# Strings of a's, the empty one included
+EMPTY_STRING_INPUT = "1\n\nS\nS A\na\nS -> AS | ε\nA -> a"
+
+
+@pytest.fixture(autouse=True)
+def empty_grammar_cache() -> Iterator[None]:
+    grammar_cache.clear()
+    yield
+    grammar_cache.clear()
+
+
+def parse(text: str) -> List[Tuple[Grammar, InputString]]:
+    lines = text.split("\n")
+    return list(parse_input(list(map(del_extra_spaces, lines[1:])), int(lines[0])))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_parsed_grammar_not_in_cnf_is_converted(engine: str) -> None:
+    for _ in range(2):
+        # The second time the grammar comes from the cache
+        [(G, string)] = parse(NON_CNF_INPUT)
+        assert solve(G, string, engine=engine).result
+
+
+def test_parsed_grammar_is_cached_converted() -> None:
+    [(G, _)] = parse(NON_CNF_INPUT)
+    [(cached, _)] = parse(NON_CNF_INPUT)
+    assert cached is G
+    assert grammar_cache.compile(G).grammar is G
+
+
+def test_parsed_grammar_takes_one_cache_entry() -> None:
+    parse(NON_CNF_INPUT)
+    assert (len(grammar_cache), grammar_cache.hits, grammar_cache.misses) == (1, 0, 1)
+    parse(NON_CNF_INPUT.replace("S -> aA", "S  ->  aA"))
+    assert (len(grammar_cache), grammar_cache.hits, grammar_cache.misses) == (1, 1, 1)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_answer_has_the_cnf_metrics(engine: str) -> None:
+    [(G, string)] = parse(NON_CNF_INPUT)
+    metrics = solve(G, string, engine=engine).cnf_metrics
+    assert metrics is not None
+    assert (metrics.variables_before, metrics.rules_before) == (2, 2)
+    assert metrics.rules_after >= metrics.rules_before
+    assert metrics.blowup == metrics.rules_after / 2
+    assert len(grammar_cache) == 1
+    [(H, string)] = parse(EMPTY_STRING_INPUT.replace("ε", "a"))
+    assert solve(H, string, engine=engine).cnf_metrics is None
+
+
+def test_server_solves_grammar_not_in_cnf() -> None:
+    server = pytest.importorskip("server")
+    assert server.solve_cyk_request(NON_CNF_INPUT) == {"cases": [{"string": "ab", "result": True}]}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_empty_string(engine: str) -> None:
+    [(G, string)] = parse(EMPTY_STRING_INPUT)
+    assert string == []
+    assert solve(G, string, engine=engine).result
+    assert recognize(G, string, engine=engine)
+    [(H, _)] = parse(EMPTY_STRING_INPUT.replace("ε", "a"))
+    assert not solve(H, string, engine=engine).result
+    assert not recognize(H, string, engine=engine)
+
+
+def test_incremental_empty_string() -> None:
+    [(G, _)] = parse(EMPTY_STRING_INPUT)
+    incremental = IncrementalCYK(G)
+    assert incremental.accepts()
+    incremental.append("a")
+    incremental.truncate(0)
+    assert incremental.accepts()
+
+
+def test_solve_many_empty_string() -> None:
+    [(G, _)] = parse(EMPTY_STRING_INPUT)
+    answers = solve_many(G, [[], [(Terminal("a"),)], []], with_table=True)
+    assert [answer.result for answer in answers] == [True, True, True]
+    assert answers[0].table == []
+
+
+def tree_depth_and_leaves(tree: Tuple) -> Tuple[int, str]:
+    depth, leaves = 0, []
+    pending = [(tree, 1)]
+    while pending:
+        node, level = pending.pop()
+        depth = max(depth, level)
+        if len(node) == 2:
+            leaves.append(str(node[1]))
+        else:
+            pending.extend([(node[2], level + 1), (node[1], level + 1)])
+    return depth, "".join(leaves)
+
+
+def test_forest_of_deep_derivation() -> None:
+    n = 1200
+    [(G, string)] = parse(f"1\n{'a' * n}\nS\nS A\na\nS -> AS | a\nA -> a")
+    forest = solve(G, string, engine="matrix", forest=True).forest
+    assert len(forest) == n - 1
+    assert forest.count() == 1
+    [tree] = list(forest.trees())
+    assert tree_depth_and_leaves(tree) == (n, "a" * n)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_forest_of_ambiguous_string(engine: str) -> None:
+    # S -> SS | a derives a^n in Catalan(n - 1) ways
+    [(G, string)] = parse("1\naaaaaaa\nS\nS\na\nS -> SS | a")
+    forest = solve(G, string, engine=engine, forest=True).forest
+    trees = list(forest.trees())
+    assert forest.count() == len(set(trees)) == len(trees) == 132
+    assert all(tree_depth_and_leaves(tree)[1] == "aaaaaaa" for tree in trees)
@@ -0,0 +1,108 @@
+import os
+from collections import deque
+from dataclasses import replace
+from typing import FrozenSet, List, Optional, Set
+
+import pytest
+
+from fsm import FSM, PARTITION_ALGORITHMS
+from generators import random_fsm, random_machine
+from main import iter_test_cases
+from simulation import Simulator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SEEDS = range(20)
+# Blocks of the final partition of every machine of test_input.txt
+TEST_INPUT_BLOCKS = [
+    [["C", "A"], ["E"], ["F", "D"], ["B"]],
+    [["A"], ["B"], ["C"], ["D"]],
+    [["I", "E"], ["F"], ["G"], ["H"]],
+    [["D"], ["E"], ["F"]],
+    [["A"], ["B"], ["C"]],
+]
+
+
+def as_sets(blocks: List[List[str]]) -> Set[FrozenSet[str]]:
+    return {frozenset(block) for block in blocks}
+
+
+def with_algorithm(fsm: FSM, partition_algorithm: str) -> FSM:
+    return replace(fsm, partition_algorithm=partition_algorithm, _partitions=None)
+
+
+def product_bfs(fsm: FSM, other: FSM) -> Optional[int]:
+    """Length of the shortest distinguishing sequence of two complete machines,
+    searching every pair of states of the product machine"""
+    start = (fsm.init_state, other.init_state)
+    depth = {start: 0}
+    pending = deque([start])
+    fsm_transitions, other_transitions = fsm._transitions, other._transitions
+    while pending:
+        p, q = pending.popleft()
+        for stimulus in fsm.S:
+            p_dest, p_output = fsm_transitions[p][stimulus]
+            q_dest, q_output = other_transitions[q][stimulus]
+            if p_output != q_output:
+                return depth[(p, q)] + 1
+            if (p_dest, q_dest) not in depth:
+                depth[(p_dest, q_dest)] = depth[(p, q)] + 1
+                pending.append((p_dest, q_dest))
+    return None
+
+
+@pytest.mark.parametrize("partition_algorithm", PARTITION_ALGORITHMS)
+def test_blocks_of_test_input(partition_algorithm: str) -> None:
+    with open(os.path.join(ROOT, "test_input.txt")) as f:
+        fsms = list(iter_test_cases(f))
+    blocks = [as_sets(with_algorithm(fsm, partition_algorithm).blocks) for fsm in fsms]
+    assert blocks == list(map(as_sets, TEST_INPUT_BLOCKS))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_algorithms_give_the_same_blocks(seed: int) -> None:
+    fsm = random_fsm(30 + seed, n_inputs=2 + seed % 3, n_outputs=2, seed=seed)
+    moore, hopcroft, vectorized = (
+        with_algorithm(fsm, algorithm).partitions for algorithm in PARTITION_ALGORITHMS
+    )
+    # The vectorized rounds are the moore rounds, block by block
+    assert vectorized == moore
+    assert as_sets(hopcroft[-1]) == as_sets(moore[-1])
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_canonical_form_of_equivalent_machines(seed: int) -> None:
+    fsm = random_machine(40, n_classes=1 + seed % 9, unreachable=0.1, seed=seed)
+    minimum = fsm.minimum_equivalent()
+    # Same machine with the states in another order and other names
+    order = list(range(len(fsm.Q)))[::-1]
+    position = {q: i for i, q in enumerate(order)}
+    k = len(fsm.S)
+    Q = tuple(f"r{q}" for q in order)
+    renamed = FSM(S=fsm.S, R=fsm.R, Q=Q, init_state=Q[position[fsm._init_state_index]])
+    for i, q in enumerate(order):
+        for a in range(k):
+            renamed._next_state[i * k + a] = position[fsm._next_state[q * k + a]]
+            renamed._output[i * k + a] = fsm._output[q * k + a]
+    assert minimum.canonical_form() == fsm.canonical_form() == renamed.canonical_form()
+    assert fsm.canonical_hash() == renamed.canonical_hash()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_distinguishing_sequence_is_shortest(seed: int) -> None:
+    n_states = 3 + seed % 5
+    fsm = random_fsm(n_states, seed=seed)
+    other = random_fsm(n_states, seed=seed + 1000)
+    sequence = fsm.distinguishing_sequence(other)
+    length = product_bfs(fsm, other)
+    assert (sequence is None) == (length is None)
+    assert (fsm.canonical_form() == other.canonical_form()) == (sequence is None)
+    if sequence is not None:
+        assert len(sequence) == length
+        assert Simulator(fsm).run(sequence)[-1] != Simulator(other).run(sequence)[-1]
+        assert Simulator(fsm).run(sequence[:-1]) == Simulator(other).run(sequence[:-1])
+
+
+def test_equivalent_to_minimum_equivalent() -> None:
+    fsm = random_machine(50, n_classes=5, unreachable=0.2, seed=1)
+    assert fsm.distinguishing_sequence(fsm.minimum_equivalent()) is None
+    assert fsm.distinguishing_sequence(fsm) is None
@@ -0,0 +1,35 @@
+from array import array
+
+import pytest
+
+from fsm import PARTITION_ALGORITHMS
+from generators import random_fsm, random_machine
+
+SEEDS = range(20)
+
+
+def test_random_fsm_is_seeded() -> None:
+    fsm = random_fsm(50, n_inputs=3, n_outputs=4, seed=7)
+    again = random_fsm(50, n_inputs=3, n_outputs=4, seed=7)
+    assert (fsm._next_state, fsm._output) == (again._next_state, again._output)
+    assert isinstance(fsm._next_state, array) and len(fsm._next_state) == 150
+    assert all(0 <= q < 50 for q in fsm._next_state) and all(0 <= r < 4 for r in fsm._output)
+    assert fsm._next_state != random_fsm(50, n_inputs=3, n_outputs=4, seed=8)._next_state
+
+
+@pytest.mark.parametrize("partition_algorithm", PARTITION_ALGORITHMS)
+@pytest.mark.parametrize("seed", SEEDS)
+def test_blocks_of_machines_with_known_classes(partition_algorithm: str, seed: int) -> None:
+    n_classes = 1 + seed % 7
+    fsm = random_machine(
+        60,
+        n_inputs=2 + seed % 2,
+        n_classes=n_classes,
+        unreachable=0.2,
+        moore=seed % 2 == 1,
+        seed=seed,
+        partition_algorithm=partition_algorithm,
+    )
+    assert len(fsm.blocks) == n_classes
+    assert sum(map(len, fsm.blocks)) == len(fsm.Q) - len(fsm.inaccessible_states)
+    assert fsm.minimum_equivalent().equivalent(fsm)
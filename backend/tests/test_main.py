@@ -0,0 +1,40 @@
+from main import iter_test_cases
+
+# Mealy machine with 3 stimuli: "q q'1 r'1 q'2 r'2 q'3 r'3" per row
+MEALY_INPUT = """1
+T
+a b c
+0 1 2
+A B C
+A B 0 C 1 A 2
+B C 2 A 0 B 1
+C A 1 B 2 C 0
+"""
+# Moore machine with 3 stimuli: "q q'1 q'2 q'3 r" per row
+MOORE_INPUT = """1
+S
+a b c
+0 1
+A B C
+A B C A 0
+B C A B 1
+C A B C 1
+"""
+
+
+def test_mealy_table_with_three_stimuli() -> None:
+    [fsm] = iter_test_cases(MEALY_INPUT.split("\n"))
+    assert fsm._transitions == {
+        "A": {"a": ("B", "0"), "b": ("C", "1"), "c": ("A", "2")},
+        "B": {"a": ("C", "2"), "b": ("A", "0"), "c": ("B", "1")},
+        "C": {"a": ("A", "1"), "b": ("B", "2"), "c": ("C", "0")},
+    }
+
+
+def test_moore_table_with_three_stimuli() -> None:
+    [fsm] = iter_test_cases(MOORE_INPUT.split("\n"))
+    assert fsm._transitions == {
+        "A": {"a": ("B", "0"), "b": ("C", "0"), "c": ("A", "0")},
+        "B": {"a": ("C", "1"), "b": ("A", "1"), "c": ("B", "1")},
+        "C": {"a": ("A", "1"), "b": ("B", "1"), "c": ("C", "1")},
+    }
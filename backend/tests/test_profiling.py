@@ -0,0 +1,53 @@
+import pytest
+
+from profiling import Profiler
+
+MIB = 2**20
+
+
+@pytest.fixture
+def profiler():
+    profiler = Profiler()
+    profiler.enable(memory=True)
+    yield profiler
+    profiler.disable()
+
+
+def peaks(profiler: Profiler):
+    return {name: phase["peak_bytes"] for name, phase in profiler.snapshot()["phases"].items()}
+
+
+def test_peak_of_memory_freed_in_the_phase(profiler):
+    with profiler.phase("temporary"):
+        data = bytearray(10 * MIB)
+        del data
+    assert peaks(profiler)["temporary"] >= 10 * MIB
+
+
+def test_nested_phases(profiler):
+    with profiler.phase("outer"):
+        kept = bytearray(4 * MIB)
+        with profiler.phase("inner"):
+            data = bytearray(10 * MIB)
+            del data
+        with profiler.phase("small"):
+            data = bytearray(MIB)
+            del data
+        del kept
+    phases = peaks(profiler)
+    assert 10 * MIB <= phases["inner"] < 11 * MIB
+    assert MIB <= phases["small"] < 2 * MIB
+    # The 10 MiB of inner on top of the 4 MiB kept by outer
+    assert phases["outer"] >= 14 * MIB
+
+
+def test_merged_peaks_keep_the_highest(profiler):
+    with profiler.phase("phase"):
+        data = bytearray(2 * MIB)
+        del data
+    other = Profiler()
+    other.merge(profiler.snapshot())
+    phase = {"calls": 1, "seconds": 0.0, "max_seconds": 0.0, "peak_bytes": 1}
+    other.merge({"phases": {"phase": phase}, "counters": {}})
+    assert other.snapshot()["phases"]["phase"]["peak_bytes"] == peaks(profiler)["phase"]
+    assert other.snapshot()["phases"]["phase"]["calls"] == 2
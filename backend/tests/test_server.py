@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+from typing import Any, Dict
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def _echo(text: str, verbose: bool) -> Dict[str, Any]:
+    return {"echo": text}
+
+
+def _die(text: str, verbose: bool) -> Dict[str, Any]:
+    os._exit(1)
+
+
+def _fail(text: str, verbose: bool) -> Dict[str, Any]:
+    raise RuntimeError("bug in the solver")
+
+
+def _offload(solver: Any, text: str) -> Any:
+    with server.app.test_request_context("/api/v1.0/test", method="POST", json={"input": text}):
+        response = server.offload(solver, str)
+    return response if isinstance(response, tuple) else (response, response.status_code)
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool():
+    server.result_cache.clear()
+    yield
+    if server._executor is not None:
+        server.discard_executor(server._executor)
+
+
+def test_dead_worker_starts_a_new_pool():
+    response, status = _offload(_die, "die")
+    assert status == 503
+    assert server._executor is None
+
+    response, status = _offload(_echo, "alive")
+    assert status == 200
+    assert response.get_json() == {"echo": "alive"}
+
+
+def test_internal_errors_are_500():
+    response, status = _offload(_fail, "fail")
+    assert status == 500
+    assert "bug" not in response.get_json()["error"]
+
+
+@pytest.mark.parametrize(
+    "path, text",
+    [
+        ("/api/v1.0/solve", ""),
+        ("/api/v1.0/solve", "2\nT\na b"),
+        ("/api/v1.0/solve", "1\nT\na\n0\nA B\nA B 0\nB C 0"),
+        ("/api/v1.0/cyk/solve", "1\nab"),
+        ("/api/v1.0/cyk/solve", "1\nab\nS\nS\na\nS -> Xa"),
+    ],
+)
+def test_invalid_input_is_400(path, text):
+    response = server.app.test_client().post(path, json={"input": text})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("verbose", ["false", "0", 0, 1, None])
+def test_verbose_must_be_a_boolean(verbose):
+    response = server.app.test_client().post(
+        "/api/v1.0/cyk/solve", json={"input": "1\nab\nS\nS\na b\nS -> ab", "verbose": verbose}
+    )
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "verbose must be a boolean"}
+
+
+def test_rows_of_the_same_state_keep_their_order():
+    # A state with several rows keeps the last one
+    client = server.app.test_client()
+    header = "1\nT\na\n0 1\nA B C\n"
+    first = client.post("/api/v1.0/solve", json={"input": header + "A B 0\nA A 1\nB A 0"})
+    second = client.post("/api/v1.0/solve", json={"input": header + "A A 1\nA B 0\nB A 0"})
+    assert second.headers["X-Cache"] == "MISS"
+    assert first.get_json()["cases"][0]["inaccessible_states"] == ["B", "C"]
+    assert sorted(second.get_json()["cases"][0]["blocks"][0]) == ["A", "B"]
+
+
+def test_blank_lines_of_cyk_inputs_are_not_ignored():
+    client = server.app.test_client()
+    clean = "1\nab\nS\nS A\na b\nS -> aA\nA -> b"
+    assert client.post("/api/v1.0/cyk/solve", json={"input": clean}).status_code == 200
+    trailing = client.post("/api/v1.0/cyk/solve", json={"input": clean + "\n\n"})
+    assert trailing.headers["X-Cache"] == "HIT"
+    blank = client.post("/api/v1.0/cyk/solve", json={"input": clean.replace("ab\n", "ab\n\n")})
+    assert blank.status_code == 400
+
+
+def test_results_of_another_format_are_not_served(monkeypatch):
+    client = server.app.test_client()
+    text = "1\nab\nS\nS A\na b\nS -> aA\nA -> b"
+    assert client.post("/api/v1.0/cyk/solve", json={"input": text}).headers["X-Cache"] == "MISS"
+    assert client.post("/api/v1.0/cyk/solve", json={"input": text}).headers["X-Cache"] == "HIT"
+    monkeypatch.setattr(server, "RESULT_FORMAT", server.RESULT_FORMAT + "+1")
+    assert client.post("/api/v1.0/cyk/solve", json={"input": text}).headers["X-Cache"] == "MISS"
+
+
+def test_workers_import_nothing_of_the_server():
+    # Pool workers import the module of the functions they run
+    code = "import sys, workers; print(sorted({'server', 'flask', 'cache'} & set(sys.modules)))"
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=backend, capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "[]"
@@ -0,0 +1,38 @@
+import random
+
+import numpy as np
+import pytest
+
+from generators import random_fsm
+from simulation import Simulator
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_run_batch_matches_run(seed: int) -> None:
+    fsm = random_fsm(20 + seed, n_inputs=2 + seed % 3, n_outputs=3, seed=seed)
+    simulator = Simulator(fsm)
+    rng = random.Random(seed)
+    sequences = [
+        [rng.choice(fsm.S) for _ in range(rng.randrange(30))] for _ in range(1 + seed * 5)
+    ]
+    assert simulator.run_batch(sequences) == [simulator.run(sequence) for sequence in sequences]
+
+
+def test_run_batch_of_nothing() -> None:
+    simulator = Simulator(random_fsm(5, seed=1))
+    assert simulator.run_batch([]) == []
+    assert simulator.run_batch([[], []]) == [[], []]
+
+
+def test_run_indices_end_states() -> None:
+    fsm = random_fsm(30, seed=2)
+    simulator = Simulator(fsm)
+    stimuli = np.random.default_rng(2).integers(len(fsm.S), size=(8, 12))
+    outputs, states = simulator.run_indices(stimuli)
+    for row, end in zip(stimuli.tolist(), states.tolist()):
+        q = fsm._init_state_index
+        for a in row:
+            q = fsm._next_state[q * len(fsm.S) + a]
+        assert q == end
+    sequences = [[fsm.S[a] for a in row] for row in stimuli.tolist()]
+    assert [[fsm.R[r] for r in row] for row in outputs.tolist()] == simulator.run_batch(sequences)
@@ -0,0 +1,66 @@
+import pytest
+
+from generators import random_fsm, random_machine
+from simulation import Simulator
+from storage import _HEADER, fsm_from_buffer, fsm_to_bytes, load_fsm, save_fsm
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_binary_round_trip(tmp_path, use_mmap: bool) -> None:
+    fsm = random_machine(50, n_inputs=3, n_outputs=3, n_classes=6, unreachable=0.2, seed=2)
+    path = str(tmp_path / "machine.fsm")
+    save_fsm(fsm, path)
+    loaded = load_fsm(path, use_mmap=use_mmap)
+    assert (loaded.S, loaded.R, loaded.init_state) == (fsm.S, fsm.R, fsm.init_state)
+    assert list(loaded.Q) == list(fsm.Q)
+    assert list(loaded._next_state) == list(fsm._next_state)
+    assert list(loaded._output) == list(fsm._output)
+    assert loaded.partition_algorithm == fsm.partition_algorithm
+    assert loaded.blocks == fsm.blocks
+    assert loaded.canonical_form() == fsm.canonical_form()
+    assert fsm_to_bytes(loaded) == fsm_to_bytes(fsm)
+
+
+def test_mapped_machine_runs_without_the_state_index(tmp_path) -> None:
+    fsm = random_fsm(100, seed=3)
+    path = str(tmp_path / "machine.fsm")
+    save_fsm(fsm, path)
+    loaded = load_fsm(path)
+    stimuli = ["0", "1", "1", "0"]
+    assert Simulator(loaded).run(stimuli) == Simulator(fsm).run(stimuli)
+    assert loaded.distinguishing_sequence(fsm) is None
+    assert loaded._state_indices is None
+
+
+def test_changes_to_a_mapped_machine_stay_in_memory(tmp_path) -> None:
+    fsm = random_fsm(10, seed=4)
+    path = str(tmp_path / "machine.fsm")
+    save_fsm(fsm, path)
+    with open(path, "rb") as f:
+        saved = f.read()
+    loaded = load_fsm(path)
+    transitions = loaded._transitions
+    dest, output = transitions["s0"]["0"]
+    new_dest = "s1" if dest != "s1" else "s2"
+    loaded.add_transition("s0", new_dest, "0", output)
+    assert loaded._transitions["s0"]["0"] == (new_dest, output)
+    with open(path, "rb") as f:
+        assert f.read() == saved
+    assert load_fsm(path)._transitions["s0"]["0"] == (dest, output)
+
+
+def test_read_only_buffer_gives_a_read_only_machine() -> None:
+    fsm = fsm_from_buffer(fsm_to_bytes(random_fsm(10, seed=5)))
+    with pytest.raises(TypeError):
+        fsm.add_transition("s0", "s1", "0", "0")
+
+
+@pytest.mark.parametrize("field, value", [(5, 10), (6, 3)])
+def test_corrupt_header(field: int, value: int) -> None:
+    data = bytearray(fsm_to_bytes(random_fsm(10, seed=6)))
+    header = list(_HEADER.unpack_from(data))
+    # Initial state past the last state, or unknown partition algorithm
+    header[field] = value
+    _HEADER.pack_into(data, 0, *header)
+    with pytest.raises(ValueError, match="corrupt FSM file"):
+        fsm_from_buffer(data)
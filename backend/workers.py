@@ -0,0 +1,96 @@
+"""Work done by the solver pool of the server. Workers import this module to run
+it, so importing it has no side effects: no Flask app, cache or profiler setup."""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import signal
+
+from main import iter_solutions
+from cyk import solve as solve_cyk, del_extra_spaces, parse_input
+from profiling import profiler
+
+
+class SolveTimeout(Exception):
+    pass
+
+
+def _raise_solve_timeout(signum: int, frame: Any) -> None:
+    raise SolveTimeout()
+
+
+def run_with_time_limit(
+    solver: Callable[[str, bool], Dict[str, Any]],
+    text: str,
+    verbose: bool,
+    seconds: float,
+    profile: str = "",
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Runs the solver in a worker, interrupting it after the given seconds so a slow
+    request gives its worker back instead of keeping it until it ends
+    Args:
+        profile (str): as PROFILE, when set the phases of the solver are recorded
+            and their snapshot is returned with the solution
+    """
+    if profile:
+        profiler.enable(memory=profile == "memory")
+        profiler.reset()
+    if not hasattr(signal, "setitimer"):
+        return solver(text, verbose), profiler.snapshot() if profile else None
+    signal.signal(signal.SIGALRM, _raise_solve_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        solution = solver(text, verbose)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    return solution, profiler.snapshot() if profile else None
+
+
+def solve_fsm_request(text: str, verbose: bool = False) -> Dict[str, Any]:
+    inp = [line.strip() for line in text.split("\n")]
+    cases: List[Dict[str, Any]] = list()
+    solutions_str = ""
+    for i, (input_fsm, minimum_connected_fsm) in enumerate(iter_solutions(inp)):
+        cases.append(
+            {
+                "inaccessible_states": input_fsm.inaccessible_states,
+                "blocks": input_fsm.blocks,
+                "minimized": {
+                    "init_state": minimum_connected_fsm.init_state,
+                    "transitions": minimum_connected_fsm._transitions,
+                },
+            }
+        )
+        if verbose:
+            solutions_str += f"TEST CASE {i+1}\n"
+            solutions_str += "INPUT AUTOMATA: \n"
+            solutions_str += str(input_fsm) + "\n\n"
+            solutions_str += "MINIMUM CONNECTED \n"
+            solutions_str += str(minimum_connected_fsm) + "\n"
+            solutions_str += "#" * 100 + "\n"
+    solution: Dict[str, Any] = {"cases": cases}
+    if verbose:
+        solution["text"] = solutions_str
+    return solution
+
+
+def solve_cyk_request(text: str, verbose: bool = False) -> Dict[str, Any]:
+    lines: List[str] = text.split("\n")
+    n = int(lines[0])
+    lines = list(map(del_extra_spaces, lines[1:]))
+    cases: List[Dict[str, Any]] = list()
+    solutions_str = ""
+    for i, (G, string) in enumerate(parse_input(lines, n)):
+        ans = solve_cyk(G, string, engine="bitset", trace=verbose)
+        cases.append({"string": "".join(str(s[0]) for s in string), "result": ans.result})
+        if verbose:
+            solutions_str += f"TEST CASE {i}\n"
+            solutions_str += f"Answer: {ans.result}\n"
+            solutions_str += f"Input string: \n{ans.string}\n"
+            solutions_str += "Table: \n"
+            for r in ans.table:
+                solutions_str += str(r) + "\n"
+            solutions_str += "Detailed explanation\n"
+            solutions_str += ans.explanation
+            solutions_str += "#" * 100 + "\n"
+    solution: Dict[str, Any] = {"cases": cases}
+    if verbose:
+        solution["text"] = solutions_str
+    return solution